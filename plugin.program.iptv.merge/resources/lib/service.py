@@ -3,7 +3,7 @@ import time
 from kodi_six import xbmc, xbmcvfs, xbmcaddon
 from six.moves.urllib.parse import unquote_plus
 
-from slyguy import router, settings, userdata, gui
+from slyguy import router, settings, userdata, gui, database
 from slyguy.constants import ADDON_DEV, KODI_VERSION
 from slyguy.util import get_kodi_string, set_kodi_string, kodi_rpc, kodi_db
 from slyguy.log import log
@@ -38,6 +38,8 @@ def start():
             userdata.set('last_run', int(time.time()))
             set_kodi_string('_iptv_merge_force_run')
 
+            database.maintenance()
+
         if restart_queued and settings.getBool('restart_pvr', False):
             if forced: progress = gui.progressbg(heading='Reloading IPTV Simple Client')
 
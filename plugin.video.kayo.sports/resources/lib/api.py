@@ -41,11 +41,12 @@ class API(object):
             else:
                 return False, token_data
 
-        userdata.set('access_token', token_data['access_token'])
-        userdata.set('expires', int(time() + token_data['expires_in'] - 15))
+        with userdata.batch():
+            userdata.set('access_token', token_data['access_token'])
+            userdata.set('expires', int(time() + token_data['expires_in'] - 15))
 
-        if 'refresh_token' in token_data:
-            userdata.set('refresh_token', token_data['refresh_token'])
+            if 'refresh_token' in token_data:
+                userdata.set('refresh_token', token_data['refresh_token'])
 
         self._set_authentication()
         return True, token_data
@@ -1,6 +1,9 @@
 from kodi_six import xbmc
 
+from slyguy import signals
+
 class Monitor(xbmc.Monitor):
-    pass
+    def onSettingsChanged(self):
+        signals.emit(signals.ON_SETTINGS_CHANGED)
 
 monitor = Monitor()
\ No newline at end of file
@@ -1,24 +1,39 @@
 import threading
 import os
+import socket
+import select
+import shutil
+import hashlib
+import tempfile
 import re
 import time
 import json
+import xml.etree.ElementTree as ET
 
 from xml.dom.minidom import parseString
-from collections import defaultdict
+from collections import defaultdict, OrderedDict, deque
+from contextlib import contextmanager
 from functools import cmp_to_key
 
+try:
+    import selectors
+except ImportError:
+    # python2 - only the threaded servers are available
+    selectors = None
+
 import arrow
+from six import BytesIO
 from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
 from six.moves.socketserver import ThreadingMixIn
-from six.moves.urllib.parse import urlparse, urljoin, unquote_plus, parse_qsl, quote_plus
+from six.moves import queue
+from six.moves.urllib.parse import urlparse, urljoin, unquote_plus, parse_qsl
 from kodi_six import xbmc
 from requests import ConnectionError
 
-from slyguy import settings, gui, inputstream
+from slyguy import settings, gui, inputstream, callbacks, ttml
 from slyguy.log import log
 from slyguy.constants import *
-from slyguy.util import check_port, remove_file, get_kodi_string, set_kodi_string, fix_url, run_plugin
+from slyguy.util import check_port, remove_file, set_kodi_string, fix_url, run_plugin
 from slyguy.plugin import failed_playback
 from slyguy.exceptions import Exit
 from slyguy.session import RawSession
@@ -35,6 +50,34 @@ REMOVE_OUT_HEADERS = ['date', 'server', 'transfer-encoding', 'keep-alive', 'conn
 DEFAULT_PORT = 52103
 HOST = '127.0.0.1'
 
+PROXY_WORKERS = 10
+PROXY_QUEUE_TIMEOUT = 10
+PROXY_KEEP_ALIVE_TIMEOUT = 30
+PROXY_POOL_KEEP_ALIVE_TIMEOUT = 2
+PROXY_SOCKET_TIMEOUT = 5
+PROXY_STOP_TIMEOUT = 5
+SESSION_MAX_REQUESTS = 6
+
+PREFETCH_MAX_BYTES = 32*1024*1024
+PREFETCH_MAX_SEGMENT = 8*1024*1024
+PREFETCH_WORKERS = 2
+PREFETCH_TIMEOUT = 10
+PREFETCH_SEEN = 500
+
+STATS_SAMPLES = 200
+THROUGHPUT_SAMPLES = 20
+THROUGHPUT_MIN_BYTES = 1024*1024
+SUBTITLE_EXTENSIONS = ('.vtt', '.webvtt', '.srt', '.ttml', '.dfxp')
+COMPRESS_ENCODINGS = ['gzip', 'deflate']
+COMPRESS_TYPES = ('text/', 'application/dash+xml', 'application/vnd.apple.mpegurl', 'application/x-mpegurl', 'application/xml', 'application/ttml+xml', 'application/json')
+RELAY_MAX_CHUNK = 256*1024
+PREWARM_MAX_CONNECTIONS = 4
+
+SEGMENTS_PATH = os.path.join(ADDON_PROFILE, 'segments')
+SUBTITLES_PATH = os.path.join(ADDON_PROFILE, 'subtitles')
+SUBTITLE_CACHE_FILES = 200
+SUBTITLE_POINTER_TTL = 60*60
+
 PORT = check_port(DEFAULT_PORT)
 if not PORT:
     PORT = check_port()
@@ -56,7 +99,565 @@ CODEC_RANKING = ['MPEG-4', 'H.264', 'H.265', 'HDR', 'H.265 Dolby Vision']
 PROXY_GLOBAL = {
     'last_quality': QUALITY_BEST,
     'session': {},
+    'callbacks': {},
+    'last_stats': None,
 }
+SESSION_LOCK = threading.Lock()
+
+XML_NAMESPACE = 'http://www.w3.org/XML/1998/namespace'
+
+def _parse_xml(data):
+    # Parse in a single pass and swap {uri}tag for the documents own prefix:tag
+    # so lookups and serialization match the original markup.
+    # Declarations stay on the element that made them as nested ones can rebind a prefix (eg. SCTE-35 in an EventStream)
+    scopes = [[{XML_NAMESPACE: 'xml'}, {XML_NAMESPACE: 'xml'}, 0]]
+    declarations = []
+
+    def _name(name, nsmap):
+        if name[0] != '{':
+            return name
+
+        uri, name = name[1:].split('}', 1)
+        prefix = nsmap.get(uri)
+        return '{}:{}'.format(prefix, name) if prefix else name
+
+    context = ET.iterparse(BytesIO(data), events=('start-ns', 'end-ns', 'start'))
+    for event, item in context:
+        if event == 'start-ns':
+            declarations.append(item)
+            continue
+
+        if event == 'end-ns':
+            scopes[-1][2] -= 1
+            if not scopes[-1][2]:
+                scopes.pop()
+            continue
+
+        attribs = list(item.attrib.items())
+
+        if declarations:
+            # element names can use the default namespace, attribute names need a prefix
+            elements, attributes = dict(scopes[-1][0]), dict(scopes[-1][1])
+            for prefix, uri in declarations:
+                for nsmap in (elements, attributes):
+                    for key in [key for key in nsmap if nsmap[key] == prefix]:
+                        nsmap.pop(key)
+
+                elements[uri] = prefix
+                if prefix:
+                    attributes[uri] = prefix
+
+            scopes.append([elements, attributes, len(declarations)])
+            attribs = [['xmlns:{}'.format(prefix) if prefix else 'xmlns', uri] for prefix, uri in declarations] + attribs
+            declarations = []
+
+        item.tag = _name(item.tag, scopes[-1][0])
+        if attribs:
+            item.attrib.clear()
+            item.attrib.update([_name(key, scopes[-1][1]), value] for key, value in attribs)
+
+    return context.root
+
+M3U8_ATTRIBS_RE = re.compile(r'([\w-]+)="?([^",]*)[",$]?')
+M3U8_URI_RE = re.compile(r'URI="/', flags=re.I)
+M3U8_PROXY_RE = re.compile(r'(https?)://', flags=re.I)
+PROXY_HOST_RE = re.compile(re.escape(PROXY_PATH) + r'(https?://[^/\s"\'<>]+)', flags=re.I)
+
+def _m3u8_attribs(line):
+    attribs = {}
+
+    for key, value in M3U8_ATTRIBS_RE.findall(line):
+        attribs[key.upper()] = value.strip()
+
+    return attribs
+
+def _m3u8_line(line, base_url):
+    if line.startswith('/'):
+        line = base_url + line[1:]
+
+    if '"/' in line:
+        line = M3U8_URI_RE.sub(lambda match: 'URI="' + base_url, line)
+
+    ## Convert to proxy paths
+    if '://' in line:
+        line = M3U8_PROXY_RE.sub(lambda match: PROXY_PATH + match.group(0), line)
+
+    return line
+
+class SegmentCache(object):
+    def __init__(self, max_bytes=PREFETCH_MAX_BYTES, workers=PREFETCH_WORKERS):
+        self._max_bytes = max_bytes
+        self._workers = workers
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._pending = {}
+        self._seen = OrderedDict()
+        self._size = 0
+        self._queue = queue.Queue(maxsize=workers*10)
+        self._threads = []
+
+    def prefetch(self, session, url, headers):
+        with self._lock:
+            # segments stay in the playlist for a few refreshes after being fetched
+            if url in self._data or url in self._pending or url in self._seen:
+                return
+
+            self._pending[url] = threading.Event()
+            self._mark_seen(url)
+
+            if not self._threads:
+                for i in range(self._workers):
+                    thread = threading.Thread(target=self._worker)
+                    thread.daemon = True
+                    thread.start()
+                    self._threads.append(thread)
+
+        try:
+            self._queue.put_nowait((session, url, headers))
+        except queue.Full:
+            with self._lock:
+                self._seen.pop(url, None)
+            self._done(url)
+
+    def _mark_seen(self, url):
+        self._seen[url] = True
+        while len(self._seen) > PREFETCH_SEEN:
+            self._seen.popitem(last=False)
+
+    def _worker(self):
+        while True:
+            session, url, headers = self._queue.get()
+
+            item = None
+            try:
+                if session is PROXY_GLOBAL['session']:
+                    item = self._fetch(session, url, headers)
+            except Exception as e:
+                log.debug('Prefetch failed: {} ({})'.format(url, e))
+            finally:
+                self._done(url, item)
+
+    def _fetch(self, session, url, headers):
+        response = session['session'].request(method='GET', url=url, headers=headers, allow_redirects=False, verify=session.get('verify_ssl', True), timeout=PREFETCH_TIMEOUT, stream=True)
+        if response.status_code != 200 or int(response.headers.get('content-length', 0)) > PREFETCH_MAX_SEGMENT:
+            response.close()
+            return None
+
+        content = response.content
+        if len(content) > PREFETCH_MAX_SEGMENT:
+            return None
+
+        headers = {}
+        for header in response.headers:
+            if header.lower() not in REMOVE_OUT_HEADERS:
+                headers[header.lower()] = response.headers[header]
+
+        log.debug('PREFETCHED: {}'.format(url))
+        return {'headers': headers, 'content': content}
+
+    def _done(self, url, item=None):
+        with self._lock:
+            event = self._pending.pop(url, None)
+
+            if item:
+                self._data[url] = item
+                self._size += len(item['content'])
+
+                while self._size > self._max_bytes:
+                    key, _item = self._data.popitem(last=False)
+                    self._size -= len(_item['content'])
+
+        if event:
+            event.set()
+
+    def get(self, url, timeout=PREFETCH_TIMEOUT):
+        with self._lock:
+            item = self._data.pop(url, None)
+            event = self._pending.get(url) if item is None else None
+
+        if event:
+            event.wait(timeout)
+            with self._lock:
+                item = self._data.pop(url, None)
+
+        if item:
+            with self._lock:
+                self._size -= len(item['content'])
+                self._mark_seen(url)
+
+        return item
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._seen.clear()
+            self._size = 0
+
+SEGMENT_CACHE = SegmentCache()
+
+class DiskCache(object):
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        self._size = 0
+
+    def _key(self, session, url):
+        return hashlib.md5(u'{}{}'.format(session.get('session_id'), url).encode('utf8')).hexdigest()
+
+    def get(self, session, url):
+        # Returns the opened file so an eviction after this can't pull it out from under the response
+        key = self._key(session, url)
+
+        with self._lock:
+            item = self._index.pop(key, None)
+            if item is None:
+                return None
+
+            try:
+                f = open(os.path.join(self._path, key), 'rb')
+            except (IOError, OSError):
+                self._size -= item['size']
+                return None
+
+            self._index[key] = item
+
+        return f, item['headers']
+
+    def writer(self, session, url, headers):
+        if not os.path.exists(self._path):
+            try: os.makedirs(self._path)
+            except OSError: pass
+
+        key = self._key(session, url)
+        return DiskCacheWriter(self, key, os.path.join(self._path, key), headers, session['disk_cache'])
+
+    def add(self, key, size, headers, max_bytes):
+        with self._lock:
+            item = self._index.pop(key, None)
+            if item:
+                self._size -= item['size']
+
+            self._index[key] = {'size': size, 'headers': headers}
+            self._size += size
+
+            while self._size > max_bytes and self._index:
+                _key, item = self._index.popitem(last=False)
+                self._size -= item['size']
+                remove_file(os.path.join(self._path, _key))
+
+    def clear(self):
+        with self._lock:
+            if not self._index and not os.path.exists(self._path):
+                return
+
+            self._index.clear()
+            self._size = 0
+            shutil.rmtree(self._path, ignore_errors=True)
+
+class DiskCacheWriter(object):
+    # Any cache I/O error just drops this entry - the client response carries on regardless
+    def __init__(self, cache, key, path, headers, max_bytes):
+        self._cache = cache
+        self._key = key
+        self._path = path
+        self._headers = dict(headers)
+        self._max_bytes = max_bytes
+        self._size = 0
+
+        # unique per writer as the same url can be fetched twice at once
+        fd, self._tmp_path = tempfile.mkstemp(prefix=key, suffix='.tmp', dir=os.path.dirname(path))
+        self._file = os.fdopen(fd, 'wb')
+
+    def write(self, chunk):
+        if not self._file:
+            return
+
+        self._size += len(chunk)
+        try:
+            if self._size > self._max_bytes:
+                raise Exception('Larger than cache size')
+
+            self._file.write(chunk)
+        except Exception as e:
+            log.debug('Segment cache write failed: {}'.format(e))
+            self._discard()
+
+    def _discard(self):
+        try: self._file.close()
+        except: pass
+        self._file = None
+        remove_file(self._tmp_path)
+
+    def close(self, complete=False):
+        if not self._file:
+            return
+
+        length = self._headers.get('content-length')
+        if not complete or (length is not None and int(length) != self._size):
+            self._discard()
+            return
+
+        try:
+            self._file.close()
+            self._file = None
+            remove_file(self._path)
+            os.rename(self._tmp_path, self._path)
+        except Exception as e:
+            # cache was cleared mid write
+            log.debug('Segment cache save failed: {}'.format(e))
+            self._discard()
+            return
+
+        self._headers['content-length'] = str(self._size)
+        self._cache.add(self._key, self._size, self._headers, self._max_bytes)
+
+DISK_CACHE = DiskCache(SEGMENTS_PATH)
+
+def _to_webvtt(data):
+    # pycaption (and bs4) are slow to import and only needed once a subtitle is converted
+    from pycaption import detect_format, WebVTTWriter, DFXPReader
+
+    text = data.decode('utf8')
+
+    reader = detect_format(text)
+    if not reader:
+        if text.lstrip(u'\ufeff').startswith('WEBVTT'):
+            return data
+
+        raise Exception('Unknown subtitle format')
+
+    if reader is DFXPReader:
+        try:
+            return ttml.to_webvtt(text).encode('utf8')
+        except ttml.TTMLError as e:
+            log.debug('TTML fallback to pycaption: {}'.format(e))
+
+    return WebVTTWriter().write(reader().read(text)).encode('utf8')
+
+class SubtitleCache(object):
+    # Converted subtitles keyed by content hash, with a url pointer so repeat plays skip the download
+    def __init__(self, path, max_files=SUBTITLE_CACHE_FILES, pointer_ttl=SUBTITLE_POINTER_TTL):
+        self._path = path
+        self._max_files = max_files
+        self._pointer_ttl = pointer_ttl
+
+    def _file(self, prefix, value):
+        if not isinstance(value, bytes):
+            value = value.encode('utf8')
+
+        return os.path.join(self._path, prefix + hashlib.md5(value).hexdigest())
+
+    def _read(self, path):
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    def _write(self, path, data):
+        # own temp file per writer as the same content can be converted by two requests at once
+        fd, tmp_path = tempfile.mkstemp(prefix='tmp_', suffix='.tmp', dir=self._path)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+
+            remove_file(path)
+            os.rename(tmp_path, path)
+        except OSError as e:
+            log.debug('Failed to write subtitle cache file: {}'.format(e))
+            remove_file(tmp_path)
+
+    def get(self, url):
+        # the url pointer expires so changed content at the same url gets downloaded again
+        path = self._file('u_', url)
+        try:
+            expired = time.time() - os.path.getmtime(path) > self._pointer_ttl
+        except OSError:
+            return None
+
+        if expired:
+            remove_file(path)
+            return None
+
+        pointer = self._read(path)
+        if not pointer:
+            return None
+
+        return self._read(os.path.join(self._path, pointer.decode('utf8')))
+
+    def convert(self, url, data):
+        if not os.path.exists(self._path):
+            os.makedirs(self._path)
+
+        path = self._file('c_', data)
+        vtt = self._read(path)
+        if vtt is None:
+            vtt = _to_webvtt(data)
+            self._write(path, vtt)
+
+        self._write(self._file('u_', url), os.path.basename(path).encode('utf8'))
+        self._prune()
+        return vtt
+
+    def _prune(self):
+        # converted files and url pointers are each kept to the newest max_files
+        names = os.listdir(self._path)
+        for prefix in ('c_', 'u_'):
+            files = [os.path.join(self._path, x) for x in names if x.startswith(prefix)]
+            if len(files) <= self._max_files:
+                continue
+
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - self._max_files]:
+                remove_file(path)
+
+SUBTITLE_CACHE = SubtitleCache(SUBTITLES_PATH)
+
+def _percentiles(values):
+    if not values:
+        return None
+
+    values = sorted(values)
+    def percentile(pct):
+        return int(values[min(len(values)-1, int(len(values) * pct))] * 1000)
+
+    return {'p50': percentile(0.5), 'p90': percentile(0.9), 'p99': percentile(0.99)}
+
+class SessionStats(object):
+    def __init__(self, session_id, samples=STATS_SAMPLES):
+        self.session_id = session_id
+        self._started = time.time()
+        self._samples = samples
+        self._types = {}
+        self._lock = threading.Lock()
+
+    def add(self, req_type, status_code, size, total, ttfb=None, parse=None, cached=False):
+        with self._lock:
+            stats = self._types.get(req_type)
+            if not stats:
+                stats = self._types[req_type] = {
+                    'requests': 0,
+                    'cached': 0,
+                    'bytes': 0,
+                    'time': 0,
+                    'status': defaultdict(int),
+                    'ttfb': deque(maxlen=self._samples),
+                    'total': deque(maxlen=self._samples),
+                    'parse': deque(maxlen=self._samples),
+                }
+
+            stats['requests'] += 1
+            stats['bytes'] += size
+            stats['time'] += total
+            stats['status'][status_code] += 1
+            stats['total'].append(total)
+
+            if cached:
+                stats['cached'] += 1
+            if ttfb is not None:
+                stats['ttfb'].append(ttfb)
+            if parse is not None:
+                stats['parse'].append(parse)
+
+    def summary(self):
+        with self._lock:
+            types = {}
+            for req_type, stats in self._types.items():
+                types[req_type] = {
+                    'requests': stats['requests'],
+                    'cached': stats['cached'],
+                    'bytes': stats['bytes'],
+                    'bps': int(stats['bytes'] * 8 / stats['time']) if stats['time'] else 0,
+                    'status': dict((str(code), count) for code, count in stats['status'].items()),
+                    'ttfb_ms': _percentiles(stats['ttfb']),
+                    'total_ms': _percentiles(stats['total']),
+                    'parse_ms': _percentiles(stats['parse']),
+                }
+
+        return {
+            'session_id': self.session_id,
+            'duration': int(time.time() - self._started),
+            'types': types,
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        if not summary['types']:
+            return
+
+        PROXY_GLOBAL['last_stats'] = summary
+
+        def pct(values):
+            return '{p50}/{p90}/{p99}ms'.format(**values) if values else '-'
+
+        log.info('Proxy session {} stats ({}s)'.format(summary['session_id'], summary['duration']))
+        for req_type in sorted(summary['types']):
+            stats = summary['types'][req_type]
+            log.info('  {}: {} requests ({} cached), {:.1f}MB, {}kbps, ttfb {}, total {}, parse {}, status {}'.format(
+                req_type, stats['requests'], stats['cached'], stats['bytes'] / 1024.0 / 1024.0, stats['bps'] // 1000,
+                pct(stats['ttfb_ms']), pct(stats['total_ms']), pct(stats['parse_ms']), stats['status']))
+
+class ThroughputMeter(object):
+    def __init__(self, samples=THROUGHPUT_SAMPLES, min_bytes=THROUGHPUT_MIN_BYTES):
+        self._samples = samples
+        self._min_bytes = min_bytes
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    def add(self, host, size, seconds):
+        if not size or seconds <= 0:
+            return
+
+        with self._lock:
+            self._hosts.setdefault(host, deque(maxlen=self._samples)).append((size, seconds))
+
+    def get(self, host):
+        with self._lock:
+            samples = list(self._hosts.get(host, []))
+
+        # weight by bytes so small manifest fetches don't swamp the estimate
+        size = sum(x[0] for x in samples)
+        seconds = sum(x[1] for x in samples)
+        if size < self._min_bytes or not seconds:
+            return None
+
+        return int(size * 8 / seconds)
+
+THROUGHPUT = ThroughputMeter()
+
+def _with_headroom(bps):
+    # the most quality selection (and the inputstream seed) may use from a measured throughput
+    headroom = settings.getInt('proxy_quality_headroom', 25)
+    return int(bps * max(0, 100 - headroom) / 100)
+
+def _prewarm_host(session, url, count, verify=True):
+    # Open pooled connections now so the first segment / license request skips DNS, TCP and TLS setup
+    # This uses urllib3's private _get_conn / _put_conn, so anything unexpected just skips prewarming
+    try:
+        adapter = session.get_adapter(url)
+        pool = adapter.get_connection(url)
+        adapter.cert_verify(pool, url, verify, None)
+        get_conn, put_conn = pool._get_conn, pool._put_conn
+    except Exception as e:
+        log.debug('Prewarm skipped: {} ({})'.format(url, e))
+        return
+
+    conns = []
+    try:
+        for i in range(count):
+            conn = get_conn()
+            conns.append(conn)
+            if conn.sock is None:
+                conn.connect()
+
+        log.debug('Prewarmed {} connections: {}'.format(count, url))
+    except Exception as e:
+        log.debug('Prewarm failed: {} ({})'.format(url, e))
+    finally:
+        for conn in conns:
+            try: put_conn(conn)
+            except Exception: pass
 
 def _lang_allowed(lang, lang_list):
     for _lang in lang_list:
@@ -69,6 +670,9 @@ def _lang_allowed(lang, lang_list):
     return False
 
 class RequestHandler(BaseHTTPRequestHandler):
+    timeout = PROXY_SOCKET_TIMEOUT
+    keep_alive_timeout = None
+
     def __init__(self, request, client_address, server):
         try:
             BaseHTTPRequestHandler.__init__(self, request, client_address, server)
@@ -78,15 +682,29 @@ class RequestHandler(BaseHTTPRequestHandler):
     def log_message(self, format, *args):
         return
 
-    def setup(self):
-        BaseHTTPRequestHandler.setup(self)
-        self.request.settimeout(5)
+    def handle(self):
+        self.close_connection = True
+        self.handle_one_request()
+
+        while not self.close_connection and self._wait_request():
+            self.handle_one_request()
+
+    def _wait_request(self):
+        # An idle keep-alive connection holds a pool worker, so only wait keep_alive_timeout for its next request
+        if not self.keep_alive_timeout or self.server._has_buffered(self):
+            return True
+
+        try:
+            return bool(select.select([self.request], [], [], self.keep_alive_timeout)[0])
+        except Exception:
+            return False
 
     def _get_url(self):
         url = self.path.lstrip('/').strip('\\')
 
         self._headers = {}
         self._plugin_headers = {}
+        self._webvtt = False
         for header in self.headers:
             if header.lower() not in REMOVE_IN_HEADERS:
                 self._headers[header.lower()] = self.headers[header]
@@ -94,23 +712,18 @@ class RequestHandler(BaseHTTPRequestHandler):
         length = int(self._headers.get('content-length', 0))
         self._post_data = self.rfile.read(length) if length else None
 
+        # Sessions are registered via PROXY_SESSION_PATH so no Kodi calls are needed here
         self._session = PROXY_GLOBAL['session']
 
-        try:
-            proxy_data = json.loads(get_kodi_string('_slyguy_quality'))
-            if self._session.get('session_id') != proxy_data['session_id']:
-                self._session = {}
-
-            self._session.update(proxy_data)
-            set_kodi_string('_slyguy_quality', '')
-        except:
-            pass
-
-        PROXY_GLOBAL['session'] = self._session
-
         url = self._session.get('path_subs', {}).get(url) or url
 
         if url.lower().startswith('plugin'):
+            webvtt_url = self._webvtt_url(url)
+            if webvtt_url:
+                # Convert in the proxy rather than invoking the plugin route
+                self._webvtt = True
+                return webvtt_url
+
             new_url = self._plugin_request(url)
 
             if url == self._session.get('license_url'):
@@ -120,19 +733,74 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         return url
 
-    def _plugin_request(self, url):
-        data_path = xbmc.translatePath('special://temp/proxy.post')
-        with open(data_path, 'wb') as f:
-            f.write(self._post_data or b'')
+    def _webvtt_url(self, url):
+        params = dict(parse_qsl(urlparse(url).query))
+        if params.get(ROUTE_TAG) == ROUTE_WEBVTT:
+            return params.get('url')
+
+        return None
+
+    def _webvtt_response(self, url):
+        data = SUBTITLE_CACHE.get(url)
+
+        if data is None:
+            _url = url
+            for i in range(5):
+                response = self._proxy_request('GET', _url)
+                if not self._session.get('redirecting'):
+                    break
+
+                _url = response.headers['location'][len(PROXY_PATH):]
+
+            if response.status_code != 200:
+                return response
+
+            try:
+                data = SUBTITLE_CACHE.convert(url, response.stream.content)
+            except Exception as e:
+                log.exception(e)
+                response.status_code = 500
+                response.stream.content = str(e).encode('utf-8')
+                return response
+        else:
+            log.debug('SUBTITLE CACHE HIT: {}'.format(url))
+
+        response = Response()
+        response.ok = True
+        response.status_code = 200
+        response.headers = {'content-type': 'text/vtt'}
+        response.stream = ResponseStream(response)
+        response.stream.content = data
+        return response
 
+    def _plugin_callback(self, url, data_path, data):
         url = add_url_args(url, _data_path=data_path, _headers=json.dumps(self._headers))
 
+        addon_id = urlparse(url).netloc
+        port = PROXY_GLOBAL['callbacks'].get(addon_id)
+        if port:
+            log.debug('PLUGIN CALLBACK WORKER REQUEST: {}'.format(url))
+            try:
+                return callbacks.request(port, url, data)
+            except Exception as e:
+                log.debug('Callback worker failed, falling back to plugin: {}'.format(e))
+                if PROXY_GLOBAL['callbacks'].get(addon_id) == port:
+                    PROXY_GLOBAL['callbacks'].pop(addon_id, None)
+
+        with open(data_path, 'wb') as f:
+            f.write(data)
+
         log.debug('PLUGIN REQUEST: {}'.format(url))
         dirs, files = run_plugin(url, wait=True)
         if not files:
             raise Exception('No data returned from plugin')
 
-        path = unquote_plus(files[0])
+        return unquote_plus(files[0])
+
+    def _plugin_request(self, url):
+        data_path = xbmc.translatePath('special://temp/proxy.post')
+        path = self._plugin_callback(url, data_path, self._post_data or b'')
+
         split = path.split('|')
         url = split[0]
 
@@ -147,17 +815,8 @@ class RequestHandler(BaseHTTPRequestHandler):
             return data
 
         data_path = xbmc.translatePath('special://temp/proxy.manifest')
-        with open(data_path, 'wb') as f:
-            f.write(data.encode('utf8'))
-
-        url = add_url_args(url, _data_path=data_path, _headers=json.dumps(self._headers))
+        path = self._plugin_callback(url, data_path, data.encode('utf8'))
 
-        log.debug('PLUGIN MANIFEST MIDDLEWARE REQUEST: {}'.format(url))
-        dirs, files = run_plugin(url, wait=True)
-        if not files:
-            raise Exception('No data returned from plugin')
-
-        path = unquote_plus(files[0])
         split = path.split('|')
         data_path = split[0]
 
@@ -172,24 +831,110 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         return data
 
+    @contextmanager
+    def _session_slot(self):
+        # Bound how many upstream requests a single playback session can have in flight
+        semaphore = self._session.setdefault('semaphore', threading.BoundedSemaphore(SESSION_MAX_REQUESTS))
+
+        try:
+            acquired = semaphore.acquire(timeout=PROXY_QUEUE_TIMEOUT)
+        except TypeError:
+            #python2
+            acquired = semaphore.acquire()
+
+        if not acquired:
+            log.warning('Proxy: Session request limit reached')
+
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                semaphore.release()
+
+    def _send_busy(self):
+        # the session already has SESSION_MAX_REQUESTS in flight - let the player retry
+        self.send_error(503, 'Session request limit reached')
+
+    def _request_type(self, url):
+        path = urlparse(url).path.lower()
+
+        if url == self._session.get('license_url'):
+            return 'license'
+        elif url == self._session.get('manifest') or path.endswith('.m3u8') or path.endswith('.m3u') or path.endswith('.mpd'):
+            return 'manifest'
+        elif path.endswith(SUBTITLE_EXTENSIONS) or url in self._session.get('path_subs', {}).values():
+            return 'subtitle'
+        else:
+            return 'segment'
+
+    def _record_stats(self, req_type, url, response, start, written, parse=None):
+        total = time.time() - start
+        ttfb = getattr(response, 'ttfb', None)
+        cached = getattr(response, 'cached', False)
+
+        if ttfb is not None and not cached and req_type in ('segment', 'manifest') and response.status_code == 200:
+            THROUGHPUT.add(urlparse(url).netloc, written, total - (parse or 0))
+
+        stats = self._session.get('stats')
+        if not stats:
+            return
+
+        try:
+            stats.add(req_type, response.status_code, written, total, ttfb=ttfb, parse=parse, cached=cached)
+        except Exception as e:
+            log.debug('Failed to record proxy stats: {}'.format(e))
+
+    def _send_stats(self):
+        session = PROXY_GLOBAL['session']
+        data = {
+            'session': session['stats'].summary() if session.get('stats') else None,
+            'last_session': PROXY_GLOBAL['last_stats'],
+        }
+        self._send_json(data)
+
     def do_GET(self):
+        if self.path.lstrip('/') == PROXY_STATS_PATH:
+            return self._send_stats()
+
+        start = time.time()
         url = self._get_url()
 
+        with self._session_slot() as acquired:
+            if not acquired:
+                return self._send_busy()
+
+            self._do_GET(url, start)
+
+    def _do_GET(self, url, start):
         log.debug('GET IN: {}'.format(url))
+        req_type = self._request_type(url)
+
+        if self._webvtt:
+            response = self._webvtt_response(url)
+            written = self._output_response(response)
+            self._record_stats('subtitle', url, response, start, written)
+            return
+
         response = self._proxy_request('GET', url)
 
-        if self._session.get('redirecting') or not self._session.get('type') or not self._session.get('manifest') or int(response.headers.get('content-length', 0)) > 1000000:
-            self._output_response(response)
+        length = int(response.headers.get('content-length') or getattr(response, 'encoded_length', 0))
+        if self._session.get('redirecting') or not self._session.get('type') or not self._session.get('manifest') or length > 1000000:
+            written = self._output_response(response)
+            self._record_stats(req_type, url, response, start, written)
             return
 
         parse = urlparse(self.path.lower())
 
+        parse_start = time.time()
+        parse_time = None
         try:
             if self._session.get('type') == 'm3u8' and (url == self._session['manifest'] or parse.path.endswith('.m3u') or parse.path.endswith('.m3u8')):
                 self._parse_m3u8(response)
+                parse_time = time.time() - parse_start
 
             elif self._session.get('type') == 'mpd' and url == self._session['manifest']:
                 self._parse_dash(response)
+                parse_time = time.time() - parse_start
                 self._session['manifest'] = None  # unset manifest url so isn't parsed again
         except Exception as e:
             log.exception(e)
@@ -201,7 +946,8 @@ class RequestHandler(BaseHTTPRequestHandler):
             response.stream.content = str(e).encode('utf-8')
             failed_playback()
 
-        self._output_response(response)
+        written = self._output_response(response)
+        self._record_stats(req_type, url, response, start, written, parse=parse_time)
 
     def _quality_select(self, qualities):
         def codec_rank(_codecs):
@@ -303,6 +1049,12 @@ class RequestHandler(BaseHTTPRequestHandler):
                 PROXY_GLOBAL['last_quality'] = quality['bandwidth'] if quality in qualities else quality
                 set_kodi_string('_slyguy_last_quality', PROXY_GLOBAL['last_quality'])
 
+        if quality == QUALITY_BEST and settings.getBool('proxy_adaptive_quality', False):
+            bps = THROUGHPUT.get(urlparse(self._session.get('manifest') or '').netloc)
+            if bps:
+                quality = _with_headroom(bps)
+                log.debug('Throughput {} bps. Capping best quality to {} bps'.format(bps, quality))
+
         if quality in (QUALITY_DISABLED, QUALITY_SKIP):
             quality = quality
         elif quality == QUALITY_BEST:
@@ -323,6 +1075,33 @@ class RequestHandler(BaseHTTPRequestHandler):
             self._session['selected_quality'] = quality
             return None
 
+    def _prewarm(self, manifest_url, data, sets):
+        if self._session.get('prewarmed') or not self._session.get('session'):
+            return
+
+        self._session['prewarmed'] = True
+        count = max(1, min(sets, PREWARM_MAX_CONNECTIONS))
+
+        hosts = OrderedDict()
+        def add_host(url, count):
+            parsed = urlparse(url or '')
+            if parsed.scheme.lower() in ('http', 'https') and parsed.netloc:
+                key = u'{}://{}/'.format(parsed.scheme.lower(), parsed.netloc)
+                hosts[key] = max(count, hosts.get(key, 0))
+
+        add_host(manifest_url, count)
+        for url in PROXY_HOST_RE.findall(data):
+            add_host(url, count)
+
+        add_host(self._session.get('license_url'), 1)
+        for sub in self._session.get('subtitles') or []:
+            add_host(sub[2], 1)
+
+        for url in hosts:
+            thread = threading.Thread(target=_prewarm_host, args=(self._session['session'], url, hosts[url], self._session.get('verify_ssl', True)))
+            thread.daemon = True
+            thread.start()
+
     def _parse_dash(self, response):
         if ADDON_DEV:
             root = parseString(response.stream.content)
@@ -341,24 +1120,45 @@ class RequestHandler(BaseHTTPRequestHandler):
         ## SUPPORT EC-3 CHANNEL COUNT https://github.com/xbmc/inputstream.adaptive/pull/618
         data = data.replace('urn:mpeg:mpegB:cicp:ChannelConfiguration', 'urn:mpeg:dash:23003:3:audio_channel_configuration:2011')
 
-        root = parseString(data.encode('utf8'))
-        mpd = root.getElementsByTagName("MPD")[0]
+        root = _parse_xml(data.encode('utf8'))
+        mpd = next(root.iter('MPD'))
 
-        mpd_attribs = list(mpd.attributes.keys())
+        parents, children = {}, {}
+        for parent in root.iter():
+            for child in parent:
+                parents[child] = parent
+
+        def remove_node(node):
+            parent = parents.pop(node, None)
+            if parent is None:
+                return
+
+            parent.remove(node)
+            siblings = children.get((parent, node.tag))
+            if siblings and node in siblings:
+                siblings.remove(node)
+
+        def append_node(parent, node):
+            parent.append(node)
+            parents[node] = parent
+            children.pop((parent, node.tag), None)
+            return node
+
+        self._session['vod'] = mpd.get('type') != 'dynamic'
 
         ## Remove publishTime PR: https://github.com/xbmc/inputstream.adaptive/pull/564
-        if 'publishTime' in mpd_attribs:
-            mpd.removeAttribute('publishTime')
+        if 'publishTime' in mpd.attrib:
+            mpd.attrib.pop('publishTime')
             log.debug('Dash Fix: publishTime removed')
 
         ## Fix mpd overalseconds bug
-        if mpd.getAttribute('type') == 'dynamic' and 'timeShiftBufferDepth' not in mpd_attribs and 'mediaPresentationDuration' not in mpd_attribs:
-            if 'availabilityStartTime' in mpd_attribs:
-                buffer_seconds = (arrow.now() - arrow.get(mpd.getAttribute('availabilityStartTime'))).total_seconds()
-                mpd.setAttribute('timeShiftBufferDepth', 'PT{}S'.format(buffer_seconds))
+        if mpd.get('type') == 'dynamic' and 'timeShiftBufferDepth' not in mpd.attrib and 'mediaPresentationDuration' not in mpd.attrib:
+            if 'availabilityStartTime' in mpd.attrib:
+                buffer_seconds = (arrow.now() - arrow.get(mpd.get('availabilityStartTime'))).total_seconds()
+                mpd.set('timeShiftBufferDepth', 'PT{}S'.format(buffer_seconds))
                 log.debug('Dash Fix: {}S timeShiftBufferDepth added'.format(buffer_seconds))
             else:
-                mpd.setAttribute('mediaPresentationDuration', 'PT60S')
+                mpd.set('mediaPresentationDuration', 'PT60S')
                 log.debug('Dash Fix: 60S mediaPresentationDuration added')
 
         ## SORT ADAPTION SETS BY BITRATE ##
@@ -370,30 +1170,27 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         default_language = self._session.get('default_language', '')
 
-        for period_index, period in enumerate(root.getElementsByTagName('Period')):
+        for period_index, period in enumerate(list(root.iter('Period'))):
             rep_index = 0
-            for adap_set in period.getElementsByTagName('AdaptationSet'):
-                adap_parent = adap_set.parentNode
+            for adap_set in list(period.iter('AdaptationSet')):
+                adap_parent = parents[adap_set]
 
                 highest_bandwidth = 0
                 is_video = False
                 is_trick = False
 
-                for stream in adap_set.getElementsByTagName("Representation"):
+                for stream in list(adap_set.iter('Representation')):
                     attribs = {}
 
                     ## Make sure Representation are last in adaptionset
-                    adap_set.removeChild(stream)
-                    adap_set.appendChild(stream)
+                    remove_node(stream)
+                    append_node(adap_set, stream)
                     #######
 
-                    for key in adap_set.attributes.keys():
-                        attribs[key] = adap_set.getAttribute(key)
-
-                    for key in stream.attributes.keys():
-                        attribs[key] = stream.getAttribute(key)
+                    attribs.update(adap_set.attrib)
+                    attribs.update(stream.attrib)
 
-                    if default_language and 'audio' in attribs.get('mimeType', '') and attribs.get('lang').lower() == default_language.lower() and adap_set not in lang_adap_sets:
+                    if default_language and 'audio' in attribs.get('mimeType', '') and attribs.get('lang', '').lower() == default_language.lower() and adap_set not in lang_adap_sets:
                         lang_adap_sets.append(adap_set)
 
                     bandwidth = 0
@@ -430,7 +1227,7 @@ class RequestHandler(BaseHTTPRequestHandler):
                         if period_index == 0:
                             streams.append(stream)
 
-                adap_parent.removeChild(adap_set)
+                remove_node(adap_set)
 
                 if is_trick:
                     continue
@@ -444,128 +1241,132 @@ class RequestHandler(BaseHTTPRequestHandler):
         audio_sets.sort(key=lambda  x: x[0], reverse=True)
 
         for elem in video_sets:
-            elem[2].appendChild(elem[1])
+            append_node(elem[2], elem[1])
 
         for elem in audio_sets:
-            elem[2].appendChild(elem[1])
+            append_node(elem[2], elem[1])
 
 
         ## Set default languae
         if lang_adap_sets:
-            for elem in root.getElementsByTagName('Role'):
-                if elem.getAttribute('schemeIdUri') == 'urn:mpeg:dash:role:2011':
-                    elem.parentNode.removeChild(elem)
+            for elem in list(root.iter('Role')):
+                if elem.get('schemeIdUri') == 'urn:mpeg:dash:role:2011':
+                    remove_node(elem)
 
             for adap_set in lang_adap_sets:
-                elem = root.createElement('Role')
-                elem.setAttribute('schemeIdUri', 'urn:mpeg:dash:role:2011')
-                elem.setAttribute('value', 'main')
-                adap_set.appendChild(elem)
+                elem = append_node(adap_set, ET.Element('Role'))
+                elem.set('schemeIdUri', 'urn:mpeg:dash:role:2011')
+                elem.set('value', 'main')
                 log.debug('default language set to: {}'.format(default_language))
         #############
 
         ## Insert subtitles
-        if adap_parent:
+        if adap_parent is not None:
             for idx, subtitle in enumerate(self._session.get('subtitles') or []):
-                elem = root.createElement('AdaptationSet')
-                elem.setAttribute('contentType', 'text')
-                elem.setAttribute('mimeType', subtitle[0])
-                elem.setAttribute('lang', subtitle[1])
-                elem.setAttribute('id', 'caption_{}'.format(idx))
-                #elem.setAttribute('forced', 'true')
-                #elem.setAttribute('original', 'true')
-                #elem.setAttribute('default', 'true')
-                #elem.setAttribute('impaired', 'true')
-
-                elem2 = root.createElement('Representation')
-                elem2.setAttribute('id', 'caption_rep_{}'.format(idx))
+                elem = append_node(adap_parent, ET.Element('AdaptationSet'))
+                elem.set('contentType', 'text')
+                elem.set('mimeType', subtitle[0])
+                elem.set('lang', subtitle[1])
+                elem.set('id', 'caption_{}'.format(idx))
+                #elem.set('forced', 'true')
+                #elem.set('original', 'true')
+                #elem.set('default', 'true')
+                #elem.set('impaired', 'true')
+
+                elem2 = append_node(elem, ET.Element('Representation'))
+                elem2.set('id', 'caption_rep_{}'.format(idx))
 
                 if 'ttml' in subtitle[0]:
-                    elem2.setAttribute('codecs', 'ttml')
-
-                elem3 = root.createElement('BaseURL')
-                elem4 = root.createTextNode(subtitle[2])
+                    elem2.set('codecs', 'ttml')
 
-                elem3.appendChild(elem4)
-                elem2.appendChild(elem3)
-                elem.appendChild(elem2)
-
-                adap_parent.appendChild(elem)
+                elem3 = append_node(elem2, ET.Element('BaseURL'))
+                elem3.text = subtitle[2]
         ##################
 
         ## REMOVE SUBS
         # if subs_whitelist:
-        #     for adap_set in root.getElementsByTagName('AdaptationSet'):
-        #         if adap_set.getAttribute('contentType') == 'text':
-        #             language = adap_set.getAttribute('lang')
+        #     for adap_set in root.iter('AdaptationSet'):
+        #         if adap_set.get('contentType') == 'text':
+        #             language = adap_set.get('lang')
         #             if not _lang_allowed(language.lower().strip(), subs_whitelist):
-        #                 adap_set.parentNode.removeChild(adap_set)
+        #                 remove_node(adap_set)
         ##
 
+        base_urls, templates, segment_urls = [], [], []
+        for elem in root.iter():
+            if elem.tag == 'BaseURL':
+                base_urls.append(elem)
+            elif elem.tag == 'SegmentTemplate':
+                templates.append(elem)
+            elif elem.tag == 'SegmentURL':
+                segment_urls.append(elem)
+
         ## Convert BaseURLS
-        base_url_parents = []
-        for elem in root.getElementsByTagName('BaseURL'):
-            url = elem.firstChild.nodeValue
+        base_url_parents = set()
+        for elem in base_urls:
+            url = elem.text or ''
 
-            if elem.parentNode in base_url_parents:
+            if parents[elem] in base_url_parents:
                 log.debug('Non-1st BaseURL removed: {}'.format(url))
-                elem.parentNode.removeChild(elem)
+                remove_node(elem)
                 continue
 
             if url.startswith('/'):
                 url = urljoin(response.url, url)
 
             if '://' in url:
-                elem.firstChild.nodeValue = PROXY_PATH + url
+                elem.text = PROXY_PATH + url
 
-            base_url_parents.append(elem.parentNode)
+            base_url_parents.add(parents[elem])
         ################
 
         ## Convert to proxy paths
-        elems = root.getElementsByTagName('SegmentTemplate')
-        elems.extend(root.getElementsByTagName('SegmentURL'))
-
         def get_parent_node(node, tag_name, levels=99):
-            if not node.parentNode or levels == 0:
+            parent = parents.get(node)
+            if parent is None or levels == 0:
                 return None
 
-            siblings = [x for x in node.parentNode.childNodes if x != node and x.nodeType == x.ELEMENT_NODE and x.tagName == tag_name]
-            if siblings:
-                return siblings[0]
-            else:
-                return get_parent_node(node.parentNode, tag_name, levels-1)
+            key = (parent, tag_name)
+            if key not in children:
+                children[key] = [x for x in parent if x.tag == tag_name]
 
-        for e in elems:
+            for sibling in children[key]:
+                if sibling is not node:
+                    return sibling
+
+            return get_parent_node(parent, tag_name, levels-1)
+
+        for e in templates + segment_urls:
             def process_attrib(attrib):
-                if attrib not in e.attributes.keys():
+                if attrib not in e.attrib:
                     return
 
-                url = e.getAttribute(attrib)
+                url = e.get(attrib)
                 if '://' in url:
-                    e.setAttribute(attrib, PROXY_PATH + url)
+                    e.set(attrib, PROXY_PATH + url)
                 else:
                     ## Fixed with https://github.com/xbmc/inputstream.adaptive/pull/606
                     base_url = get_parent_node(e, 'BaseURL')
-                    if base_url and not base_url.firstChild.nodeValue.endswith('/'):
-                        base_url.firstChild.nodeValue = base_url.firstChild.nodeValue + '/'
+                    if base_url is not None and not (base_url.text or '').endswith('/'):
+                        base_url.text = (base_url.text or '') + '/'
                         log.debug('Dash Fix: base_url / fixed')
 
                     # Fixed with https://github.com/xbmc/inputstream.adaptive/pull/668
                     parent_template = get_parent_node(e, 'SegmentTemplate', levels=2)
-                    if parent_template:
-                        for key in parent_template.attributes.keys():
-                            if key not in e.attributes.keys():
-                                e.setAttribute(key, parent_template.getAttribute(key))
+                    if parent_template is not None:
+                        for key in parent_template.attrib:
+                            if key not in e.attrib:
+                                e.set(key, parent_template.get(key))
 
-                        parent_template.parentNode.removeChild(parent_template)
+                        remove_node(parent_template)
                         log.debug('Dash Fix: Double SegmentTemplate removed')
 
             process_attrib('initialization')
             process_attrib('media')
 
             ## Remove presentationTimeOffset PR: https://github.com/xbmc/inputstream.adaptive/pull/564/
-            if 'presentationTimeOffset' in e.attributes.keys():
-                e.removeAttribute('presentationTimeOffset')
+            if 'presentationTimeOffset' in e.attrib:
+                e.attrib.pop('presentationTimeOffset')
                 log.debug('Dash Fix: presentationTimeOffset removed')
         ###############
 
@@ -574,52 +1375,73 @@ class RequestHandler(BaseHTTPRequestHandler):
         if selected:
             for stream in all_streams:
                 if stream['rep_index'] != selected['rep_index']:
-                    stream['elem'].parentNode.removeChild(stream['elem'])
+                    remove_node(stream['elem'])
         #################
 
         ## Remove empty adaption sets
-        for adap_set in root.getElementsByTagName('AdaptationSet'):
-            if not adap_set.getElementsByTagName('Representation'):
-                adap_set.parentNode.removeChild(adap_set)
+        for adap_set in list(root.iter('AdaptationSet')):
+            if next(adap_set.iter('Representation'), None) is None:
+                remove_node(adap_set)
         #################
 
+        mpd = ET.tostring(root, encoding='utf-8')
+        self._prewarm(response.url, mpd.decode('utf8'), len(list(root.iter('AdaptationSet'))))
+
         if ADDON_DEV:
-            mpd = root.toprettyxml(encoding='utf-8')
+            mpd = parseString(mpd).toprettyxml(encoding='utf-8')
             mpd = b"\n".join([ll.rstrip() for ll in mpd.splitlines() if ll.strip()])
 
             log.debug('Time taken: {}'.format(time.time() - start))
             with open(xbmc.translatePath('special://temp/out.mpd'), 'wb') as f:
                 f.write(mpd)
-        else:
-            mpd = root.toxml(encoding='utf-8')
 
         response.stream.content = mpd
 
-    def _parse_m3u8_sub(self, m3u8, master_url):
-        lines = []
+    def _parse_m3u8_sub(self, m3u8, url):
+        base_url = urljoin(url, '/')
+
+        ## Live playlists are refetched every target duration, so reuse the
+        ## rewritten lines from the last refresh and only process new ones
+        cache = self._session.setdefault('m3u8_cache', {})
+        prev_lines = cache.get(url) or {}
+        new_lines = {}
 
+        lines, segments = [], []
         for line in m3u8.splitlines():
-            if not line.startswith('#') and '/beacon?' in line.lower():
-                parse = urlparse(line)
-                params = dict(parse_qsl(parse.query))
-                for key in params:
-                    if key.lower() == 'redirect_path':
-                        line = params[key]
-                        log.debug('M3U8 Fix: Beacon removed')
+            new_line = prev_lines.get(line)
 
-            lines.append(line)
+            if new_line is None:
+                new_line = line
 
-        return '\n'.join(lines)
+                if not line.startswith('#') and '/beacon?' in line.lower():
+                    parse = urlparse(line)
+                    params = dict(parse_qsl(parse.query))
+                    for key in params:
+                        if key.lower() == 'redirect_path':
+                            new_line = params[key]
+                            log.debug('M3U8 Fix: Beacon removed')
 
-    def _parse_m3u8_master(self, m3u8, master_url):
-        def _process_media(line):
-            attribs = {}
+                if new_line.strip() and not new_line.startswith('#'):
+                    segments.append(fix_url(urljoin(url, new_line)))
+
+                new_line = _m3u8_line(new_line, base_url)
+
+            new_lines[line] = new_line
+            lines.append(new_line)
 
-            for key, value in re.findall('([\w-]+)="?([^",]*)[",$]?', line):
-                attribs[key.upper()] = value.strip()
+        cache[url] = new_lines
+        self._session['vod'] = '#EXT-X-ENDLIST' in m3u8
 
-            return attribs
+        ## Prefetch the newest segments of live playlists
+        prefetch = self._session.get('prefetch', 0)
+        if prefetch > 0 and segments and '#EXT-X-ENDLIST' not in m3u8 and '#EXT-X-BYTERANGE' not in m3u8:
+            headers = dict(self._headers)
+            for segment in segments[-prefetch:]:
+                SEGMENT_CACHE.prefetch(self._session, segment, headers)
 
+        return lines
+
+    def _parse_m3u8_master(self, m3u8, master_url):
         audio_whitelist   = [x.strip().lower() for x in self._session.get('audio_whitelist', '').split(',') if x]
         subs_whitelist    = [x.strip().lower() for x in self._session.get('subs_whitelist', '').split(',') if x]
         subs_forced       = self._session.get('subs_forced', True)
@@ -635,39 +1457,70 @@ class RequestHandler(BaseHTTPRequestHandler):
             audio_whitelist.append(original_language)
             audio_whitelist.append(default_language)
 
+        lines = m3u8.splitlines()
+
         default_groups = []
         groups = defaultdict(list)
-        for line in m3u8.splitlines():
-            if not line.startswith('#EXT-X-MEDIA'):
-                continue
+        line1 = None
+        streams, all_streams, urls, metas = [], [], [], []
 
-            attribs = _process_media(line)
-            if not attribs:
+        for index, line in enumerate(lines):
+            if not line.strip():
                 continue
 
-            if audio_whitelist and attribs.get('TYPE') == 'AUDIO' and 'LANGUAGE' in attribs and not _lang_allowed(attribs['LANGUAGE'].lower().strip(), audio_whitelist):
-                m3u8 = m3u8.replace(line, '')
-                continue
+            if line.startswith('#EXT-X-MEDIA'):
+                attribs = _m3u8_attribs(line)
+                if not attribs:
+                    continue
 
-            if subs_whitelist and attribs.get('TYPE') == 'SUBTITLES' and 'LANGUAGE' in attribs and not _lang_allowed(attribs['LANGUAGE'].lower().strip(), subs_whitelist):
-                m3u8 = m3u8.replace(line, '')
-                continue
+                if audio_whitelist and attribs.get('TYPE') == 'AUDIO' and 'LANGUAGE' in attribs and not _lang_allowed(attribs['LANGUAGE'].lower().strip(), audio_whitelist):
+                    lines[index] = None
+                    continue
 
-            if not subs_forced and attribs.get('TYPE') == 'SUBTITLES' and attribs.get('FORCED','').upper() == 'YES':
-                m3u8 = m3u8.replace(line, '')
-                continue
+                if subs_whitelist and attribs.get('TYPE') == 'SUBTITLES' and 'LANGUAGE' in attribs and not _lang_allowed(attribs['LANGUAGE'].lower().strip(), subs_whitelist):
+                    lines[index] = None
+                    continue
 
-            if not subs_non_forced and attribs.get('TYPE') == 'SUBTITLES' and attribs.get('FORCED','').upper() != 'YES':
-                m3u8 = m3u8.replace(line, '')
-                continue
+                if not subs_forced and attribs.get('TYPE') == 'SUBTITLES' and attribs.get('FORCED','').upper() == 'YES':
+                    lines[index] = None
+                    continue
 
-            if not audio_description and attribs.get('TYPE') == 'AUDIO' and attribs.get('CHARACTERISTICS','').lower() == 'public.accessibility.describes-video':
-                m3u8 = m3u8.replace(line, '')
-                continue
+                if not subs_non_forced and attribs.get('TYPE') == 'SUBTITLES' and attribs.get('FORCED','').upper() != 'YES':
+                    lines[index] = None
+                    continue
+
+                if not audio_description and attribs.get('TYPE') == 'AUDIO' and attribs.get('CHARACTERISTICS','').lower() == 'public.accessibility.describes-video':
+                    lines[index] = None
+                    continue
+
+                groups[attribs['GROUP-ID']].append([attribs, index])
+                if attribs.get('DEFAULT') == 'YES' and attribs['GROUP-ID'] not in default_groups:
+                    default_groups.append(attribs['GROUP-ID'])
 
-            groups[attribs['GROUP-ID']].append([attribs, line])
-            if attribs.get('DEFAULT') == 'YES' and attribs['GROUP-ID'] not in default_groups:
-                default_groups.append(attribs['GROUP-ID'])
+            elif line.startswith('#EXT-X-STREAM-INF'):
+                line1 = index
+
+            elif line1 and not line.startswith('#'):
+                attribs = _m3u8_attribs(lines[line1])
+
+                codecs     = [x for x in attribs.get('CODECS', '').split(',') if x]
+                bandwidth  = int(attribs.get('BANDWIDTH') or 0)
+                resolution = attribs.get('RESOLUTION', '')
+                frame_rate = attribs.get('FRAME_RATE', '')
+
+                url = line
+                if '://' in url:
+                    url = '/'+'/'.join(url.lower().split('://')[1].split('/')[1:])
+
+                stream = {'bandwidth': int(bandwidth), 'resolution': resolution, 'frame_rate': frame_rate, 'codecs': codecs, 'url': url, 'lines': [line1, index]}
+                all_streams.append(stream)
+
+                if stream['url'] not in urls and lines[line1] not in metas:
+                    streams.append(stream)
+                    urls.append(stream['url'])
+                    metas.append(lines[line1])
+
+                line1 = None
 
         if default_language:
             for group_id in groups:
@@ -676,7 +1529,7 @@ class RequestHandler(BaseHTTPRequestHandler):
 
                 languages = []
                 for group in groups[group_id]:
-                    attribs, line = group
+                    attribs, index = group
 
                     attribs['AUTOSELECT'] = 'NO'
                     attribs['DEFAULT']    = 'NO'
@@ -691,7 +1544,7 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         for group_id in groups:
             for group in groups[group_id]:
-                attribs, line = group
+                attribs, index = group
 
                 # FIX es-ES > es / fr-FR > fr languages #
                 if 'LANGUAGE' in attribs:
@@ -704,49 +1557,17 @@ class RequestHandler(BaseHTTPRequestHandler):
                 for key in attribs:
                     new_line += u'{}="{}",'.format(key, attribs[key])
 
-                m3u8 = m3u8.replace(line, new_line.rstrip(','))
-
-        lines = list(m3u8.splitlines())
-        line1 = None
-        streams, all_streams, urls, metas = [], [], [], []
-        for index, line in enumerate(lines):
-            if not line.strip():
-                continue
-
-            if line.startswith('#EXT-X-STREAM-INF'):
-                line1 = index
-            elif line1 and not line.startswith('#'):
-                attribs = _process_media(lines[line1])
-
-                codecs     = [x for x in attribs.get('CODECS', '').split(',') if x]
-                bandwidth  = int(attribs.get('BANDWIDTH') or 0)
-                resolution = attribs.get('RESOLUTION', '')
-                frame_rate = attribs.get('FRAME_RATE', '')
-
-                url = line
-                if '://' in url:
-                    url = '/'+'/'.join(url.lower().split('://')[1].split('/')[1:])
-
-                stream = {'bandwidth': int(bandwidth), 'resolution': resolution, 'frame_rate': frame_rate, 'codecs': codecs, 'url': url, 'lines': [line1, index]}
-                all_streams.append(stream)
-
-                if stream['url'] not in urls and lines[line1] not in metas:
-                    streams.append(stream)
-                    urls.append(stream['url'])
-                    metas.append(lines[line1])
-
-                line1 = None
+                lines[index] = new_line.rstrip(',')
 
         selected = self._quality_select(streams)
         if selected:
-            adjust = 0
             for stream in all_streams:
                 if stream['url'] != selected['url']:
                     for index in stream['lines']:
-                        lines.pop(index-adjust)
-                        adjust += 1
+                        lines[index] = None
 
-        return '\n'.join(lines)
+        base_url = urljoin(master_url, '/')
+        return [_m3u8_line(line, base_url) for line in lines if line is not None]
 
     def _parse_m3u8(self, response):
         m3u8 = response.stream.content.decode('utf8')
@@ -770,17 +1591,15 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         if is_master:
             m3u8 = self._manifest_middleware(m3u8)
-            m3u8 = self._parse_m3u8_master(m3u8, response.url)
+            lines = self._parse_m3u8_master(m3u8, response.url)
         else:
-            m3u8 = self._parse_m3u8_sub(m3u8, response.url)
-
-        base_url = urljoin(response.url, '/')
+            lines = self._parse_m3u8_sub(m3u8, response.url)
 
-        m3u8 = re.sub(r'^/', r'{}'.format(base_url), m3u8, flags=re.I|re.M)
-        m3u8 = re.sub(r'URI="/', r'URI="{}'.format(base_url), m3u8, flags=re.I|re.M)
+        m3u8 = u'\n'.join(lines)
 
-        ## Convert to proxy paths
-        m3u8 = re.sub(r'(https?)://', r'{}\1://'.format(PROXY_PATH), m3u8, flags=re.I)
+        if is_master:
+            media_types = set(_m3u8_attribs(line).get('TYPE') for line in lines if line.startswith('#EXT-X-MEDIA'))
+            self._prewarm(response.url, m3u8, 1 + len(media_types))
 
         m3u8 = m3u8.encode('utf8')
 
@@ -803,9 +1622,8 @@ class RequestHandler(BaseHTTPRequestHandler):
             if os.path.exists(url):
                 response.ok = True
                 response.status_code = 200
-                with open(url, 'rb') as f:
-                    response.stream.content = f.read()
-                if not ADDON_DEV: remove_file(url)
+                response.headers['content-length'] = str(os.path.getsize(url))
+                response.stream = FileResponseStream(response, url, remove=not ADDON_DEV)
             else:
                 response.ok = False
                 response.status_code = 500
@@ -828,11 +1646,45 @@ class RequestHandler(BaseHTTPRequestHandler):
         ## Fix any double // in url
         url = fix_url(url)
 
+        if method == 'GET' and 'range' not in self._headers:
+            item = SEGMENT_CACHE.get(url)
+            if item:
+                log.debug('PREFETCH HIT: {}'.format(url))
+                response = Response()
+                response.cached = True
+                response.ok = True
+                response.status_code = 200
+                response.headers = dict(item['headers'])
+                response.stream = ResponseStream(response)
+                response.stream.content = item['content']
+                return response
+
+        use_disk_cache = method == 'GET' and self._session.get('vod') and self._session.get('disk_cache') and 'range' not in self._headers and url != self._session.get('manifest')
+        if use_disk_cache:
+            item = DISK_CACHE.get(self._session, url)
+            if item:
+                log.debug('DISK CACHE HIT: {}'.format(url))
+                response = Response()
+                response.cached = True
+                response.ok = True
+                response.status_code = 200
+                response.headers = dict(item[1])
+                response.stream = FileResponseStream(response, item[0].name, file=item[0])
+                return response
+
+        headers = self._headers
+        # Servers only compress text types, so asking on every full request leaves media segments untouched
+        compress = 'range' not in self._headers
+        if compress:
+            headers = dict(self._headers)
+            headers['accept-encoding'] = ', '.join(COMPRESS_ENCODINGS)
+
+        request_start = time.time()
         retries = 3
         # some reason we get connection errors every so often when using a session. something to do with the socket
         for i in range(retries):
             try:
-                response = self._session['session'].request(method=method, url=url, headers=self._headers, data=self._post_data, allow_redirects=False, verify=self._session.get('verify_ssl', True), stream=True)
+                response = self._session['session'].request(method=method, url=url, headers=headers, data=self._post_data, allow_redirects=False, verify=self._session.get('verify_ssl', True), stream=True)
             except ConnectionError as e:
                 if 'Connection aborted' not in str(e) or i == retries-1:
                     log.exception(e)
@@ -843,6 +1695,7 @@ class RequestHandler(BaseHTTPRequestHandler):
             else:
                 break
 
+        response.ttfb = time.time() - request_start
         response.stream = ResponseStream(response)
 
         log.debug('{} OUT: {} ({})'.format(method.upper(), url, response.status_code))
@@ -854,6 +1707,21 @@ class RequestHandler(BaseHTTPRequestHandler):
 
         response.headers = headers
 
+        if compress and headers.get('content-encoding', '').lower() in COMPRESS_ENCODINGS and \
+                (headers.get('content-type', '').lower().startswith(COMPRESS_TYPES) or self._request_type(url) != 'segment'):
+            # Decode text payloads (and anything the proxy rewrites) before the rewrite stages and the client see it
+            response.stream.decode = True
+            response.encoded_length = int(headers.pop('content-length', 0) or 0)
+            headers.pop('content-encoding')
+
+        if use_disk_cache and response.status_code == 200 and not self._session.get('redirecting'):
+            path = urlparse(url).path.lower()
+            if not path.endswith('.m3u8') and not path.endswith('.m3u') and not path.endswith('.mpd'):
+                try:
+                    response.stream.cache = DISK_CACHE.writer(self._session, url, headers)
+                except Exception as e:
+                    log.debug('Failed to create segment cache file: {}'.format(e))
+
         if debug:
             with open(xbmc.translatePath('special://temp/{}-response.txt').format(method.lower()), 'wb') as f:
                 f.write(response.stream.content)
@@ -890,25 +1758,144 @@ class RequestHandler(BaseHTTPRequestHandler):
         self.end_headers()
 
     def _output_response(self, response):
+        has_body = self.command != 'HEAD' and response.status_code not in (204, 304) and response.status_code >= 200
+        length = response.headers.get('content-length')
+
+        chunked = False
+        if self.protocol_version == 'HTTP/1.1' and has_body and length is None:
+            # Length is unknown - chunk it if the client can keep-alive, otherwise close when done
+            if self.request_version == 'HTTP/1.1':
+                response.headers['transfer-encoding'] = 'chunked'
+                chunked = True
+            else:
+                response.headers['connection'] = 'close'
+                self.close_connection = True
+
         self._output_headers(response)
 
-        for chunk in response.stream.iter_content():
-            try:
-                self.wfile.write(chunk)
-            except Exception as e:
-                break
+        written = 0
+        if not has_body:
+            # HEAD / 204 / 304 - anything written now would be read as the next response on a keep-alive connection
+            self.wfile.flush()
+            response.stream.close()
+        elif chunked:
+            for chunk in response.stream.iter_content():
+                try:
+                    self.wfile.write('{:x}\r\n'.format(len(chunk)).encode('utf8'))
+                    self.wfile.write(chunk)
+                    self.wfile.write(b'\r\n')
+                except Exception as e:
+                    self.close_connection = True
+                    break
+
+                written += len(chunk)
+        else:
+            self.wfile.flush()
+            written = response.stream.relay(self.connection)
+
+        if chunked and not self.close_connection:
+            try: self.wfile.write(b'0\r\n\r\n')
+            except: self.close_connection = True
+
+        elif has_body and length is not None and written != int(length):
+            # Upstream ended early - can't reuse the connection
+            self.close_connection = True
+
+        return written
 
     def do_HEAD(self):
+        start = time.time()
         url = self._get_url()
         log.debug('HEAD IN: {}'.format(url))
-        response = self._proxy_request('HEAD', url)
-        self._output_response(response)
+
+        with self._session_slot() as acquired:
+            if not acquired:
+                return self._send_busy()
+
+            req_type = self._request_type(url)
+            response = self._proxy_request('HEAD', url)
+            written = self._output_response(response)
+            self._record_stats(req_type, url, response, start, written)
+
+    def _register_session(self):
+        length = int(self.headers.get('content-length', 0))
+        proxy_data = json.loads(self.rfile.read(length).decode('utf8'))
+
+        with SESSION_LOCK:
+            session = PROXY_GLOBAL['session']
+            if session.get('session_id') != proxy_data['session_id']:
+                if session.get('stats'):
+                    session['stats'].log_summary()
+
+                new_session = {'stats': SessionStats(proxy_data['session_id'])}
+
+                # Same addon - keep its upstream connection pool warm for channel zaps
+                if session.get('session') and session.get('addon_id') == proxy_data.get('addon_id') and session.get('dns_rewrites') == proxy_data.get('dns_rewrites'):
+                    new_session['session'] = session['session']
+                    new_session['session'].cookies.clear()
+                    # another Session may have taken over getaddrinfo since the last play
+                    new_session['session'].set_dns_rewrites(proxy_data.get('dns_rewrites', []))
+
+                session = new_session
+                SEGMENT_CACHE.clear()
+                DISK_CACHE.clear()
+
+                if settings.getBool('proxy_adaptive_quality', False) and settings.getBool('proxy_seed_bandwidth', False):
+                    bps = THROUGHPUT.get(urlparse(proxy_data.get('manifest') or '').netloc)
+                    if bps:
+                        inputstream.set_bandwidth_bin(_with_headroom(bps))
+
+            session.update(proxy_data)
+            session['prefetch'] = settings.getInt('proxy_prefetch', 0)
+            session['disk_cache'] = settings.getInt('proxy_vod_cache', 0) * 1024 * 1024
+            PROXY_GLOBAL['session'] = session
+
+        log.debug('Proxy session registered: {}'.format(proxy_data['session_id']))
+
+        self._send_json({'callback_worker': proxy_data.get('addon_id') in PROXY_GLOBAL['callbacks']})
+
+    def _register_callback(self):
+        length = int(self.headers.get('content-length', 0))
+        data = json.loads(self.rfile.read(length).decode('utf8'))
+
+        workers = PROXY_GLOBAL['callbacks']
+        if data.get('active', True):
+            workers[data['addon_id']] = data['port']
+            log.debug('Callback worker registered: {} ({})'.format(data['addon_id'], data['port']))
+        elif workers.get(data['addon_id']) == data['port']:
+            workers.pop(data['addon_id'], None)
+            log.debug('Callback worker unregistered: {}'.format(data['addon_id']))
+
+        self._send_json({})
+
+    def _send_json(self, data):
+        body = json.dumps(data).encode('utf8')
+
+        self.send_response(200)
+        self.send_header('content-type', 'application/json')
+        self.send_header('content-length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
     def do_POST(self):
+        if self.path.lstrip('/') == PROXY_SESSION_PATH:
+            return self._register_session()
+
+        if self.path.lstrip('/') == PROXY_CALLBACK_PATH:
+            return self._register_callback()
+
+        start = time.time()
         url = self._get_url()
         log.debug('POST IN: {}'.format(url))
-        response = self._proxy_request('POST', url)
-        self._output_response(response)
+
+        with self._session_slot() as acquired:
+            if not acquired:
+                return self._send_busy()
+
+            req_type = self._request_type(url)
+            response = self._proxy_request('POST', url)
+            written = self._output_response(response)
+            self._record_stats(req_type, url, response, start, written)
 
         # if not response.ok and url == self._session.get('license_url') and gui.yes_no(_.WV_FAILED, heading=_.IA_WIDEVINE_DRM):
         #     inputstream.install_widevine(reinstall=True)
@@ -920,6 +1907,8 @@ class ResponseStream(object):
     def __init__(self, response):
         self._response = response
         self._bytes = None
+        self.cache = None
+        self.decode = False
 
     @property
     def content(self):
@@ -938,24 +1927,392 @@ class ResponseStream(object):
         self._response.headers.pop('content-range', None)
         self._response.headers.pop('content-encoding', None)
 
+        if self.cache:
+            self.cache.close()
+            self.cache = None
+
+    def close(self):
+        # Drop the body without sending it
+        if self.cache:
+            self.cache.close(complete=False)
+            self.cache = None
+
+        try: self._response.close()
+        except: pass
+
+    def relay(self, sock):
+        # Copy the body straight to the client socket. Returns the number of bytes written
+        # Reads into one buffer from urllib3's underlying http.client response (private _fp).
+        # If that isn't there or doesn't behave, fall back to raw.read via _relay_chunks
+        fp = getattr(getattr(self._response, 'raw', None), '_fp', None)
+        if self._bytes is not None or self.decode or not callable(getattr(fp, 'readinto', None)):
+            return self._relay_chunks(sock)
+
+        size = CHUNK_SIZE
+        view = memoryview(bytearray(size))
+        written = 0
+        complete = False
+        fallback = False
+
+        try:
+            while True:
+                try:
+                    read = fp.readinto(view)
+                except (AttributeError, TypeError) as e:
+                    log.debug('Relay readinto failed: {}'.format(e))
+                    fallback = not written
+                    break
+                except:
+                    break
+
+                if not read:
+                    complete = True
+                    break
+
+                if self.cache:
+                    self.cache.write(view[:read])
+
+                try:
+                    sock.sendall(view[:read])
+                except:
+                    break
+
+                written += read
+
+                # Fast upstream - grow the buffer so we make fewer calls
+                if read == size and size < RELAY_MAX_CHUNK:
+                    size *= 2
+                    view = memoryview(bytearray(size))
+        finally:
+            if self.cache and not fallback:
+                self.cache.close(complete=complete)
+                self.cache = None
+
+            if complete:
+                try: self._response.raw.release_conn()
+                except: pass
+
+        if fallback:
+            return self._relay_chunks(sock)
+
+        return written
+
+    def _relay_chunks(self, sock):
+        written = 0
+        chunks = self.iter_content()
+
+        try:
+            for chunk in chunks:
+                try:
+                    sock.sendall(chunk)
+                except:
+                    break
+
+                written += len(chunk)
+        finally:
+            chunks.close()
+
+        return written
+
+    def _chunks(self):
+        if self.decode:
+            for chunk in self._response.raw.stream(CHUNK_SIZE, decode_content=True):
+                yield chunk
+            return
+
+        while True:
+            chunk = self._response.raw.read(CHUNK_SIZE)
+            if not chunk:
+                break
+
+            yield chunk
+
     def iter_content(self):
         if self._bytes is not None:
             yield self._bytes
-        else:
+            return
+
+        complete = False
+        chunks = self._chunks()
+        try:
             while True:
                 try:
-                    chunk = self._response.raw.read(CHUNK_SIZE)
+                    chunk = next(chunks)
+                except StopIteration:
+                    complete = True
+                    break
                 except:
-                    chunk = None
-
-                if not chunk:
                     break
 
+                if self.cache:
+                    self.cache.write(chunk)
+
                 yield chunk
+        finally:
+            if self.cache:
+                self.cache.close(complete=complete)
+                self.cache = None
+
+class FileResponseStream(ResponseStream):
+    def __init__(self, response, path, remove=False, file=None):
+        super(FileResponseStream, self).__init__(response)
+        self._path = path
+        self._remove = remove
+        self._file = file
+
+    def _open(self):
+        f, self._file = self._file, None
+        return f or open(self._path, 'rb')
+
+    def _done(self):
+        if self._remove:
+            remove_file(self._path)
+            self._remove = False
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+        self._done()
+
+    @property
+    def content(self):
+        if not self._bytes:
+            with self._open() as f:
+                self.content = f.read()
+            self._done()
+
+        return self._bytes
+
+    @content.setter
+    def content(self, _bytes):
+        ResponseStream.content.fset(self, _bytes)
+
+    def iter_content(self):
+        if self._bytes is not None:
+            yield self._bytes
+            return
+
+        try:
+            with self._open() as f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+
+                    yield chunk
+        finally:
+            self._done()
+
+    def relay(self, sock):
+        if self._bytes is not None or not hasattr(sock, 'sendfile'):
+            return super(FileResponseStream, self).relay(sock)
+
+        try:
+            with self._open() as f:
+                try:
+                    return sock.sendfile(f)
+                except:
+                    return f.tell()
+        finally:
+            self._done()
 
 class ThreadedHTTPServer(ThreadingMixIn, HTTPServer):
     daemon_threads = True
 
+class PooledHTTPServer(HTTPServer):
+    def __init__(self, server_address, handler, workers=PROXY_WORKERS):
+        HTTPServer.__init__(self, server_address, handler)
+        self._queue = queue.Queue(maxsize=workers*2)
+        self._workers = []
+
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker)
+            thread.daemon = True
+            thread.start()
+            self._workers.append(thread)
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+
+            self._process_job(job)
+
+    def _process_job(self, job):
+        request, client_address = job
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def _put_job(self, job, block=True):
+        # Blocks while all workers are busy, unless the caller can't wait
+        try:
+            self._queue.put(job, block=block, timeout=PROXY_QUEUE_TIMEOUT)
+        except queue.Full:
+            log.warning('Proxy: Worker queue full. Dropping connection')
+            self._reject(job)
+
+    def _reject(self, job):
+        request, client_address = job
+        self.shutdown_request(request)
+
+    def _has_buffered(self, handler):
+        # Pipelined requests may already be sitting in rfile where select can't see them
+        sock = handler.request
+        timeout = sock.gettimeout()
+        sock.setblocking(False)
+        try:
+            return bool(handler.rfile.peek(1))
+        except Exception:
+            return False
+        finally:
+            sock.settimeout(timeout)
+
+    def process_request(self, request, client_address):
+        self._put_job((request, client_address))
+
+    def server_close(self):
+        HTTPServer.server_close(self)
+
+        # Drop anything still queued so there is room for the stop markers
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+
+            if job is not None:
+                self._reject(job)
+
+        for thread in self._workers:
+            try:
+                self._queue.put_nowait(None)
+            except queue.Full:
+                break
+
+        # Workers are daemon threads - don't hang Kodi exit on one stuck in a request
+        deadline = time.time() + PROXY_STOP_TIMEOUT
+        for thread in self._workers:
+            thread.join(max(0, deadline - time.time()))
+
+        self._workers = []
+
+class SelectorHTTPServer(PooledHTTPServer):
+    # Idle keep-alive connections wait in a selector instead of holding a worker.
+    # A connection is only handed to a worker once its next request is readable.
+    def __init__(self, server_address, handler, workers=PROXY_WORKERS):
+        PooledHTTPServer.__init__(self, server_address, handler, workers=workers)
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._selector.register(self._wakeup_r, selectors.EVENT_READ)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._idle = {}
+        self._running = True
+        self._poll_thread = threading.Thread(target=self._poll)
+        self._poll_thread.daemon = True
+        self._poll_thread.start()
+
+    def process_request(self, request, client_address):
+        handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+        handler.request = request
+        handler.client_address = client_address
+        handler.server = self
+
+        try:
+            handler.setup()
+        except Exception:
+            self.handle_error(request, client_address)
+            self.shutdown_request(request)
+        else:
+            self._watch(handler)
+
+    def _watch(self, handler):
+        with self._lock:
+            self._pending.append(handler)
+
+        try: self._wakeup_w.send(b'\0')
+        except: pass
+
+    def _close(self, handler):
+        try: handler.finish()
+        except: pass
+        self.shutdown_request(handler.request)
+
+    def _reject(self, handler):
+        self._close(handler)
+
+    def _process_job(self, handler):
+        handler.close_connection = True
+
+        try:
+            handler.handle_one_request()
+        except Exception:
+            handler.close_connection = True
+            self.handle_error(handler.request, handler.client_address)
+
+        if handler.close_connection:
+            self._close(handler)
+        elif self._has_buffered(handler):
+            self._put_job(handler)
+        else:
+            self._watch(handler)
+
+    def _poll(self):
+        while self._running:
+            for key, events in self._selector.select(timeout=1):
+                if key.fileobj is self._wakeup_r:
+                    try:
+                        while self._wakeup_r.recv(1024): pass
+                    except: pass
+                    continue
+
+                handler = key.data
+                self._selector.unregister(key.fileobj)
+                self._idle.pop(handler, None)
+                # never block here, it would stall every other idle connection
+                self._put_job(handler, block=False)
+
+            with self._lock:
+                pending, self._pending = self._pending, []
+
+            _time = time.time()
+            for handler in pending:
+                try:
+                    self._selector.register(handler.request, selectors.EVENT_READ, handler)
+                except Exception:
+                    self._close(handler)
+                else:
+                    self._idle[handler] = _time
+
+            for handler in [x for x in self._idle if _time - self._idle[x] > PROXY_KEEP_ALIVE_TIMEOUT]:
+                self._selector.unregister(handler.request)
+                self._idle.pop(handler)
+                self._close(handler)
+
+    def server_close(self):
+        self._running = False
+        self._wakeup_w.send(b'\0')
+        self._poll_thread.join(PROXY_STOP_TIMEOUT)
+
+        PooledHTTPServer.server_close(self)
+
+        for handler in list(self._idle) + self._pending:
+            self._close(handler)
+
+        self._idle.clear()
+        self._pending = []
+        self._selector.close()
+        self._wakeup_r.close()
+        self._wakeup_w.close()
+
 class Proxy(object):
     started = False
 
@@ -963,12 +2320,23 @@ class Proxy(object):
         if self.started:
             return
 
-        self._server = ThreadedHTTPServer((HOST, PORT), RequestHandler)
+        DISK_CACHE.clear()
+
+        if settings.getBool('proxy_keep_alive', False):
+            RequestHandler.protocol_version = 'HTTP/1.1'
+            server = SelectorHTTPServer if selectors else PooledHTTPServer
+            RequestHandler.keep_alive_timeout = None if selectors else PROXY_POOL_KEEP_ALIVE_TIMEOUT
+            self._server = server((HOST, PORT), RequestHandler, workers=settings.getInt('proxy_workers', PROXY_WORKERS) or PROXY_WORKERS)
+        else:
+            RequestHandler.protocol_version = 'HTTP/1.0'
+            RequestHandler.keep_alive_timeout = None
+            self._server = ThreadedHTTPServer((HOST, PORT), RequestHandler)
+
         self._server.allow_reuse_address = True
         self._httpd_thread = threading.Thread(target=self._server.serve_forever)
         self._httpd_thread.start()
         self.started = True
-        log.info("Proxy Started: {}:{}".format(HOST, PORT))
+        log.info("Proxy Started: {}:{} ({})".format(HOST, PORT, RequestHandler.protocol_version))
 
     def stop(self):
         if not self.started:
@@ -978,5 +2346,12 @@ class Proxy(object):
         self._server.server_close()
         self._server.socket.close()
         self._httpd_thread.join()
+
+        stats = PROXY_GLOBAL['session'].pop('stats', None)
+        if stats:
+            stats.log_summary()
+
+        SEGMENT_CACHE.clear()
+        DISK_CACHE.clear()
         self.started = False
         log.debug("Proxy: Stopped")
@@ -0,0 +1,4 @@
+from . import importtime
+
+if importtime.ENABLED:
+    importtime.install()
@@ -1,22 +1,32 @@
+import zlib
+import threading
 from time import time
 from functools import wraps
 
 import peewee
+from six.moves import cPickle
 
-from . import database, settings, signals, gui, router
-from .constants import CACHE_TABLENAME, CACHE_EXPIRY, CACHE_CHECKSUM, CACHE_CLEAN_INTERVAL, CACHE_CLEAN_KEY, ROUTE_CLEAR_CACHE
+from . import database, settings, signals, gui, router, flight
+from .constants import CACHE_TABLENAME, CACHE_EXPIRY, CACHE_CHECKSUM, CACHE_CLEAN_INTERVAL, CACHE_CLEAN_KEY, CACHE_SIZE_KEY, CACHE_MAX_SIZE, CACHE_COMPRESS_SIZE, CACHE_TOUCH_INTERVAL, CACHE_STALE_TIMEOUT, ROUTE_CLEAR_CACHE
+from .settings import common_settings
 from .util import hash_6
 from .log import log
 from .language import _
 
 funcs   = []
+stats   = {'hits': 0, 'misses': 0, 'evictions': 0}
+refreshing = {}
 
 class Cache(database.Model):
     checksum = CACHE_CHECKSUM
 
-    key     = database.HashField(unique=True)
-    value   = database.PickleField()
-    expires = peewee.IntegerField()
+    key        = database.HashField(unique=True)
+    value      = peewee.BlobField()
+    compressed = peewee.BooleanField(default=False)
+    size       = peewee.IntegerField(default=0)
+    expires    = peewee.IntegerField()
+    refresh    = peewee.IntegerField()
+    accessed   = peewee.IntegerField(index=True)
 
     class Meta:
         table_name = CACHE_TABLENAME
@@ -59,7 +69,7 @@ def _build_key(func_name, *args, **kwargs):
     return hash_6(key)
 
 def cached(*args, **kwargs):
-    def decorator(f, expires=CACHE_EXPIRY, key=None):
+    def decorator(f, expires=CACHE_EXPIRY, key=None, stale_ttl=0):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             _key = key or _build_key(f.__name__, *args, **kwargs)
@@ -67,14 +77,18 @@ def cached(*args, **kwargs):
                 _key = _key(*args, **kwargs)
 
             if not kwargs.pop('_skip_cache', False):
-                value = get(_key)
+                value, stale = _get(_key, None, stale_ttl > 0)
                 if value != None:
-                    log('Cache Hit: {}'.format(_key))
+                    if stale:
+                        log('Cache Stale Hit: {}'.format(_key))
+                        _refresh(_key, f, args, kwargs, expires, stale_ttl)
+                    else:
+                        log('Cache Hit: {}'.format(_key))
                     return value
 
-            value = f(*args, **kwargs)
+            value = flight.run(_key, lambda: f(*args, **kwargs))
             if value != None:
-                set(_key, value, expires)
+                set(_key, value, expires, stale_ttl)
 
             return value
 
@@ -83,31 +97,164 @@ def cached(*args, **kwargs):
 
     return lambda f: decorator(f, *args, **kwargs)
 
-def get(key, default=None):
+def _dumps(value):
+    data = cPickle.dumps(value)
+
+    if CACHE_COMPRESS_SIZE and len(data) > CACHE_COMPRESS_SIZE:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return compressed, True
+
+    return data, False
+
+def _loads(data, compressed):
+    data = bytes(data)
+    if compressed:
+        data = zlib.decompress(data)
+
+    return cPickle.loads(data)
+
+def _get(key, default=None, allow_stale=False):
     if not enabled():
-        return default
+        return default, False
+
+    now = int(time())
 
     try:
-        return Cache.get(Cache.key == key, Cache.expires > time()).value
+        row = Cache.select(Cache.id, Cache.value, Cache.compressed, Cache.refresh, Cache.accessed).where(Cache.key == key,
+            (Cache.expires if allow_stale else Cache.refresh) > now).get()
     except Cache.DoesNotExist:
-        return default
+        stats['misses'] += 1
+        return default, False
+
+    stats['hits'] += 1
+    if now - row.accessed >= CACHE_TOUCH_INTERVAL:
+        Cache.update(accessed=now).where(Cache.id == row.id).execute()
+
+    return _loads(row.value, row.compressed), row.refresh <= now
+
+def get(key, default=None):
+    return _get(key, default)[0]
+
+def set(key, value, expires=CACHE_EXPIRY, stale_ttl=0):
+    data, compressed = _dumps(value)
+
+    now = int(time())
+    refresh = int(now + expires)
+    Cache.set(key=key, value=data, compressed=compressed, size=len(data), expires=refresh + max(stale_ttl, 0), refresh=refresh, accessed=now)
+
+    budget = max_size()
+    if budget:
+        total = _grow(len(data))
+        if total is None or total > budget:
+            evict()
+
+def _refresh(key, f, args, kwargs, expires, stale_ttl):
+    if key in refreshing:
+        return
 
-def set(key, value, expires=CACHE_EXPIRY):
-    expires = int(time() + expires)
-    Cache.set(key=key, value=value, expires=expires)
+    def worker():
+        try:
+            value = flight.run(key, lambda: f(*args, **kwargs))
+            if value != None:
+                set(key, value, expires, stale_ttl)
+        except Exception as e:
+            log.debug('Cache: Refresh of {} failed'.format(key))
+            log.exception(e)
+        finally:
+            database.db.close()
+
+    thread = threading.Thread(target=worker)
+    thread.daemon = True
+    thread.start()
+    refreshing[key] = thread
+
+@signals.on(signals.AFTER_DISPATCH)
+def wait_refresh():
+    for key in list(refreshing):
+        refreshing.pop(key).join(CACHE_STALE_TIMEOUT)
 
 def delete(key):
     return Cache.delete_where(Cache.key == key)
 
 def empty():
     deleted = Cache.truncate()
+    database.KeyStore.delete_where(database.KeyStore.key == CACHE_SIZE_KEY)
     log('Cache: Deleted {} Rows'.format(deleted))
 
+def max_size():
+    return max(common_settings.getInt('cache_max_size', CACHE_MAX_SIZE), 0) * 1024 * 1024
+
+def _grow(size):
+    # running total of cached bytes so writes don't need a SUM over the table.
+    # replaced rows aren't subtracted, so it can only over count until evict() resets it
+    if not database.KeyStore.update(value=database.KeyStore.value.cast('INTEGER') + size).where(database.KeyStore.key == CACHE_SIZE_KEY).execute():
+        return None
+
+    try:
+        return int(database.KeyStore.get(database.KeyStore.key == CACHE_SIZE_KEY).value)
+    except (database.KeyStore.DoesNotExist, ValueError):
+        return None
+
+def evict():
+    budget = max_size()
+    if not budget:
+        return 0
+
+    total = Cache.select(peewee.fn.SUM(Cache.size)).scalar() or 0
+    excess = total - budget
+
+    # expired rows go first, then least recently used
+    ids = []
+    if excess > 0:
+        query = Cache.select(Cache.id, Cache.size).order_by((Cache.expires > int(time())).asc(), Cache.accessed.asc())
+        for row_id, size in query.tuples():
+            ids.append(row_id)
+            total -= size
+            excess -= size
+            if excess <= 0:
+                break
+
+    database.KeyStore.set(key=CACHE_SIZE_KEY, value=str(total))
+    if not ids:
+        return 0
+
+    deleted = Cache.delete_where(Cache.id.in_(ids))
+    stats['evictions'] += deleted
+    log('Cache: Evicted {} Rows'.format(deleted))
+
+    return deleted
+
+def get_stats():
+    rows, size = Cache.select(peewee.fn.COUNT(Cache.id), peewee.fn.SUM(Cache.size)).tuples().get()
+
+    data = dict(stats)
+    data.update({'rows': rows, 'size': size or 0, 'max_size': max_size()})
+    return data
+
 @signals.on(signals.BEFORE_DISPATCH)
 def remove_expired():
-    deleted = Cache.delete_where(Cache.expires < int(time()))
+    now = int(time())
+
+    try:
+        last_cleaned = int(database.KeyStore.get(database.KeyStore.key == CACHE_CLEAN_KEY).value)
+    except (database.KeyStore.DoesNotExist, ValueError):
+        last_cleaned = 0
+
+    if 0 <= now - last_cleaned < CACHE_CLEAN_INTERVAL:
+        return
+
+    deleted = Cache.delete_where(Cache.expires < now)
+    database.KeyStore.set(key=CACHE_CLEAN_KEY, value=str(now))
     log('Cache: Deleted {} Expired Rows'.format(deleted))
 
+    evict()
+
+@signals.on(signals.AFTER_DISPATCH)
+def log_stats():
+    if any(stats.values()):
+        log.debug('Cache Stats: {hits} hits, {misses} misses, {evictions} evictions'.format(**stats))
+
 @router.route(ROUTE_CLEAR_CACHE)
 def clear_cache(key, **kwargs):
     delete_count = delete(key)
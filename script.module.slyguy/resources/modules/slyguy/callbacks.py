@@ -0,0 +1,92 @@
+import json
+import time
+import socket
+from contextlib import closing
+
+from kodi_six import xbmc
+
+from . import settings
+from .log import log
+from .constants import ADDON_ID, PROXY_CALLBACK_PATH, CALLBACK_WORKER_TIMEOUT
+from .util import proxy_post
+
+## Messages are a json header line followed by header['length'] bytes of data ##
+def _read_message(f):
+    line = f.readline()
+    if not line:
+        return None, None
+
+    header = json.loads(line.decode('utf8'))
+    length = header.get('length', 0)
+    data = f.read(length) if length else b''
+
+    return header, data
+
+def _write_message(f, header, data=b''):
+    header['length'] = len(data)
+    f.write(json.dumps(header).encode('utf8') + b'\n')
+    f.write(data)
+    f.flush()
+
+def request(port, url, data=None, timeout=60):
+    with closing(socket.create_connection(('127.0.0.1', port), timeout=timeout)) as sock:
+        with closing(sock.makefile('rwb')) as f:
+            _write_message(f, {'url': url}, data or b'')
+            header, _ = _read_message(f)
+
+    if header is None:
+        raise IOError('No response from callback worker')
+
+    if 'error' in header:
+        raise IOError(header['error'])
+
+    return header['path']
+
+def _register(port, active=True):
+    proxy_path = settings.common_settings.get('_proxy_path')
+    proxy_post(proxy_path + PROXY_CALLBACK_PATH, {'addon_id': ADDON_ID, 'port': port, 'active': active})
+
+def run_worker(handler, timeout=CALLBACK_WORKER_TIMEOUT):
+    monitor = xbmc.Monitor()
+
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.bind(('127.0.0.1', 0))
+    server.listen(5)
+    server.settimeout(1)
+    port = server.getsockname()[1]
+
+    try:
+        _register(port)
+        log.debug('Callback worker listening on port: {}'.format(port))
+
+        last_request = time.time()
+        while not monitor.abortRequested() and time.time() - last_request < timeout:
+            try:
+                sock = server.accept()[0]
+            except socket.timeout:
+                continue
+
+            sock.settimeout(None)
+            with closing(sock), closing(sock.makefile('rwb')) as f:
+                header, data = _read_message(f)
+                if header is None:
+                    continue
+
+                try:
+                    path = handler(header['url'], data)
+                except Exception as e:
+                    log.exception(e)
+                    _write_message(f, {'error': str(e)})
+                else:
+                    _write_message(f, {'path': path or ''})
+
+            last_request = time.time()
+    finally:
+        server.close()
+
+        try:
+            _register(port, active=False)
+        except Exception as e:
+            log.debug('Failed to unregister callback worker: {}'.format(e))
+
+    log.debug('Callback worker stopped')
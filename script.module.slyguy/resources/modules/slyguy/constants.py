@@ -26,6 +26,7 @@ except:
 DB_PATH         = os.path.join(ADDON_PROFILE, 'data.db')
 DB_MAX_INSERTS  = 100
 DB_PRAGMAS      = {
+    'auto_vacuum': 2, #incremental
     'journal_mode': 'wal',
     'cache_size': -1 * 10000,  #10MB
     'foreign_keys': 1,
@@ -33,10 +34,16 @@ DB_PRAGMAS      = {
     'synchronous': 0
 }
 DB_TABLENAME = '_db'
+DB_SCHEMA_PATH       = DB_PATH + '.schema' # Fingerprint of the last verified schema
+DB_MAINTENANCE_KEY   = '_maintenance'
+DB_INCREMENTAL_PAGES = 256  # Free pages released on each close
+DB_VACUUM_MIN_PAGES  = 1024 # Don't bother with a full VACUUM on small dbs
+DB_VACUUM_RATIO      = 0.25 # Full VACUUM from the service once this much of the db is free pages
 ###################
 
 ##### USERDATA ####
-USERDATA_KEY = '_userdata'
+USERDATA_KEY  = '_userdata' # Legacy json blob setting, migrated into USERDATA_FILE
+USERDATA_FILE = 'userdata.db'
 ###############
 
 ##### CACHE #####
@@ -45,8 +52,20 @@ CACHE_CHECKSUM       = ADDON_VERSION # Recreates cache when new addon version
 CACHE_EXPIRY         = (60*60*24) # 24 Hours
 CACHE_CLEAN_INTERVAL = (60*60*4)  # 4 Hours
 CACHE_CLEAN_KEY      = '_cache_cleaned'
+CACHE_SIZE_KEY       = '_cache_size'
+CACHE_MAX_SIZE       = 50          # MB, 0 = unlimited
+CACHE_COMPRESS_SIZE  = (1024*16)   # zlib values larger than this, 0 = disabled
+CACHE_TOUCH_INTERVAL = 60          # Only rewrite last accessed once a minute
+CACHE_STALE_TIMEOUT  = 30          # Max wait after dispatch for stale-while-revalidate refreshes
+MEM_CACHE_PATH       = os.path.join(xbmc.translatePath('special://temp'), 'slyguy', ADDON_ID + '.cache')
 #################
 
+##### SINGLE FLIGHT #####
+FLIGHT_PATH     = os.path.join(ADDON_PROFILE, 'flight')
+FLIGHT_TIMEOUT  = 30  # Max wait on another process before computing ourselves
+FLIGHT_POLL     = 0.1
+#########################
+
 IPTV_MERGE_ID        = 'plugin.program.iptv.merge'
 
 #### ROUTING ####
@@ -72,6 +91,7 @@ ROUTE_BOOKMARKS        = '_bookmarks'
 ROUTE_MOVE_BOOKMARK    = '_move_bookmark'
 ROUTE_RENAME_BOOKMARK  = '_name_bookmark'
 ROUTE_WEBVTT           = '_webvtt'
+ROUTE_CALLBACK_WORKER  = '_callback_worker'
 #################
 
 #### INPUTSTREAM ADAPTIVE #####
@@ -122,5 +142,9 @@ DEFAULT_WORKERS   = 5
 BOOKMARK_FILE = os.path.join(ADDON_PROFILE, 'bookmarks.json')
 
 CHUNK_SIZE = 64 * 1024
+PROXY_SESSION_PATH = '_slyguy/session'
+PROXY_CALLBACK_PATH = '_slyguy/callback'
+PROXY_STATS_PATH = '_slyguy/stats'
+CALLBACK_WORKER_TIMEOUT = 60*10
 LIVE_HEAD = 12*60*60
 NEWS_MAX_TIME = 432000 #5 Days
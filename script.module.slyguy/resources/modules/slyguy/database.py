@@ -1,14 +1,15 @@
 import os
 import json
 import codecs
+from time import time
 
 import peewee
 from six.moves import cPickle
 
 from . import userdata, signals
 from .log import log
-from .util import hash_6
-from .constants import DB_PATH, DB_PRAGMAS, DB_MAX_INSERTS, DB_TABLENAME, ADDON_DEV
+from .util import hash_6, remove_file
+from .constants import DB_PATH, DB_PRAGMAS, DB_MAX_INSERTS, DB_TABLENAME, DB_SCHEMA_PATH, DB_MAINTENANCE_KEY, DB_INCREMENTAL_PAGES, DB_VACUUM_MIN_PAGES, DB_VACUUM_RATIO, ADDON_DEV, ADDON_VERSION, COMMON_ADDON
 
 path = os.path.dirname(DB_PATH)
 if not os.path.exists(path):
@@ -132,7 +133,23 @@ class KeyStore(Model):
         table_name = DB_TABLENAME
 
 tables = [KeyStore]
+
+def _schema_fingerprint():
+    # schema only changes with an addon or slyguy update (or in dev)
+    return hash_6([ADDON_VERSION, COMMON_ADDON.getAddonInfo('version'), [(table.table_name(), table.checksum) for table in tables]])
+
+def _read_fingerprint():
+    try:
+        with open(DB_SCHEMA_PATH, 'r') as f:
+            return f.read().strip()
+    except IOError:
+        return None
+
 def check_tables():
+    fingerprint = _schema_fingerprint()
+    if not ADDON_DEV and os.path.exists(DB_PATH) and _read_fingerprint() == fingerprint:
+        return
+
     with db.atomic():
         for table in tables:
             key      = table.table_name()
@@ -146,16 +163,74 @@ def check_tables():
 
             KeyStore.set(key=key, value=checksum)
 
+    try:
+        with open(DB_SCHEMA_PATH, 'w') as f:
+            f.write(fingerprint)
+    except IOError:
+        log.debug('DB: Failed to write schema fingerprint')
+
 @signals.on(signals.AFTER_RESET)
 def delete():
     close()
+    remove_file(DB_SCHEMA_PATH)
     if os.path.exists(DB_PATH):
         os.remove(DB_PATH)
 
+def _pragma(name):
+    return db.execute_sql('PRAGMA {}'.format(name)).fetchone()[0]
+
+def incremental_vacuum(pages=DB_INCREMENTAL_PAGES):
+    if _pragma('auto_vacuum') != 2:
+        return 0
+
+    free = min(_pragma('freelist_count'), pages)
+    if free:
+        # sqlite3's execute only steps the pragma once (one page), executescript runs it to completion
+        db.connection().executescript('PRAGMA incremental_vacuum({});'.format(free))
+
+    return free
+
+@signals.on(signals.ON_SERVICE)
+def maintenance(force=False):
+    opened = db.connect(reuse_if_open=True)
+
+    try:
+        pages = _pragma('page_count')
+        free  = _pragma('freelist_count')
+        mode  = _pragma('auto_vacuum')
+
+        # dbs created before auto_vacuum was set need one VACUUM to switch over
+        if not force and mode == 2 and (pages < DB_VACUUM_MIN_PAGES or free < pages * DB_VACUUM_RATIO):
+            return False
+
+        start = time()
+        db.execute_sql('PRAGMA auto_vacuum = 2')
+        db.execute_sql('VACUUM')
+        taken = time() - start
+
+        result = {'time': int(start), 'taken': round(taken, 3), 'pages': pages, 'free': free, 'after': _pragma('page_count')}
+        log.info('DB: VACUUM {pages} pages ({free} free) -> {after} pages in {taken}s'.format(**result))
+        KeyStore.set(key=DB_MAINTENANCE_KEY, value=json.dumps(result))
+
+        return True
+    except Exception as e:
+        log.debug('DB: Maintenance failed: {}'.format(e))
+        return False
+    finally:
+        if opened:
+            db.close()
+
 @signals.on(signals.ON_CLOSE)
 def close():
-    try:  db.execute_sql('VACUUM')
-    except: log.debug('Failed to vacuum db')
+    if not db.is_closed():
+        try:
+            start = time()
+            freed = incremental_vacuum()
+            if freed:
+                log.debug('DB: Released {} free pages in {:.3f}s'.format(freed, time() - start))
+        except:
+            log.debug('Failed to incremental vacuum db')
+
     db.close()
 
 @signals.on(signals.BEFORE_DISPATCH)
@@ -1,6 +1,5 @@
 import os
 
-import requests
 from kodi_six import xbmc
 
 from .log import log
@@ -20,6 +19,8 @@ def get_dns_rewrites():
 
 @cached(expires=60*5)
 def _get_url(url):
+    import requests
+
     log.debug('Request DNS URL: {}'.format(url))
     return requests.get(url).text
 
@@ -0,0 +1,132 @@
+import os
+import uuid
+import hashlib
+from time import time
+
+from kodi_six import xbmc
+from six.moves import cPickle
+
+from .log import log
+from .util import remove_file
+from .constants import FLIGHT_PATH, FLIGHT_TIMEOUT, FLIGHT_POLL
+
+## Cross process single-flight: one process runs func for a key while the others wait for its pickled result ##
+## The result is only written to disk when a waiter has left a .wait marker ##
+
+def _paths(key):
+    name = hashlib.md5(u'{}'.format(key).encode('utf8')).hexdigest()
+    return [os.path.join(FLIGHT_PATH, name + ext) for ext in ('.lock', '.result', '.wait')]
+
+def _acquire(lock_path, token, timeout):
+    if not os.path.exists(FLIGHT_PATH):
+        try: os.makedirs(FLIGHT_PATH)
+        except OSError: pass
+
+    for i in range(2):
+        try:
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError:
+            # lock left behind by a process that died
+            try: age = time() - os.path.getmtime(lock_path)
+            except OSError: age = 0
+
+            if age > timeout:
+                remove_file(lock_path)
+                continue
+
+            return False
+
+        with os.fdopen(fd, 'w') as f:
+            f.write(token)
+
+        return True
+
+    return False
+
+def _release(lock_path, token):
+    # a waiter may have taken over a lock it thought was stale, so only remove our own
+    if _read_token(lock_path) == token:
+        remove_file(lock_path)
+
+def _prune(timeout):
+    # results and markers only need to outlive their waiters
+    now = time()
+    for name in os.listdir(FLIGHT_PATH):
+        path = os.path.join(FLIGHT_PATH, name)
+        try:
+            if name.endswith(('.result', '.wait')) and now - os.path.getmtime(path) > timeout:
+                os.remove(path)
+        except OSError:
+            pass
+
+def _read_token(lock_path):
+    try:
+        with open(lock_path, 'r') as f:
+            return f.read()
+    except IOError:
+        return None
+
+def _wait(lock_path, result_path, wait_path, timeout):
+    try:
+        with open(wait_path, 'a'):
+            pass
+    except IOError:
+        return False, None
+
+    monitor = xbmc.Monitor()
+    token = None
+    start = time()
+
+    while True:
+        current = _read_token(lock_path)
+        if current is None:
+            break
+
+        token = current or token
+        if time() - start >= timeout or monitor.waitForAbort(FLIGHT_POLL):
+            return False, None
+
+    if not token:
+        return False, None
+
+    try:
+        with open(result_path, 'rb') as f:
+            result_token, value = cPickle.load(f)
+    except Exception:
+        return False, None
+
+    if result_token != token:
+        return False, None
+
+    return True, value
+
+def run(key, func, timeout=FLIGHT_TIMEOUT):
+    lock_path, result_path, wait_path = _paths(key)
+    token = uuid.uuid4().hex
+
+    if not _acquire(lock_path, token, timeout):
+        log.debug('Single Flight: Waiting on {}'.format(key))
+        found, value = _wait(lock_path, result_path, wait_path, timeout)
+        if found:
+            log.debug('Single Flight: Shared result for {}'.format(key))
+            return value
+
+        return func()
+
+    try:
+        value = func()
+
+        if os.path.exists(wait_path):
+            try:
+                with open(result_path, 'wb') as f:
+                    cPickle.dump((token, value), f, protocol=cPickle.HIGHEST_PROTOCOL)
+            except Exception as e:
+                log.debug('Single Flight: Failed to share result for {}: {}'.format(key, e))
+                remove_file(result_path)
+
+            remove_file(wait_path)
+            _prune(timeout)
+
+        return value
+    finally:
+        _release(lock_path, token)
@@ -1,10 +1,9 @@
 import sys
-import json
 import traceback
 import time
 from contextlib import contextmanager
 
-from six.moves.urllib_parse import quote, urlparse
+from six.moves.urllib_parse import quote, urlparse, parse_qsl
 from kodi_six import xbmcgui, xbmc
 
 from . import settings
@@ -12,8 +11,9 @@ from .constants import *
 from .exceptions import GUIError
 from .router import add_url_args, url_for
 from .language import _
+from .log import log
 from .dns import get_dns_rewrites
-from .util import url_sub, fix_url, set_kodi_string, hash_6
+from .util import url_sub, fix_url, hash_6, proxy_post, run_plugin
 
 def _make_heading(heading=None):
     return heading if heading else ADDON_NAME
@@ -171,6 +171,30 @@ def info(item):
     dialog = xbmcgui.Dialog()
     dialog.info(item.get_li())
 
+def set_proxy_session(proxy_path, proxy_data):
+    try:
+        return proxy_post(proxy_path + PROXY_SESSION_PATH, proxy_data)
+    except Exception as e:
+        # playing on would use the proxy's previous session (wrong manifest, license and quality)
+        log.error('Failed to register proxy session: {}'.format(e))
+        raise GUIError(_.PROXY_SESSION_ERROR)
+
+def _needs_callbacks(proxy_data):
+    urls = [proxy_data.get('license_url'), proxy_data.get('manifest_middleware')]
+    urls.extend(proxy_data.get('path_subs', {}).values())
+
+    for url in urls:
+        if not url or not url.lower().startswith('plugin://'):
+            continue
+
+        # the proxy converts webvtt subtitle routes itself
+        if dict(parse_qsl(urlparse(url).query)).get(ROUTE_TAG) == ROUTE_WEBVTT:
+            continue
+
+        return True
+
+    return False
+
 class Item(object):
     def __init__(self, id=None, label='', path=None, playable=False, info=None, context=None,
             headers=None, cookies=None, properties=None, is_folder=None, art=None, inputstream=None,
@@ -234,7 +258,7 @@ class Item(object):
 
         return string.strip('&')
 
-    def get_li(self):
+    def get_li(self, play=False):
         if KODI_VERSION < 18:
             li = xbmcgui.ListItem()
         else:
@@ -422,7 +446,11 @@ class Item(object):
 
                 li.setSubtitles(list(subs))
 
-            set_kodi_string('_slyguy_quality', json.dumps(proxy_data))
+            # only register when actually playing, not for every listed item
+            if play and proxy_path and (self.use_proxy or _needs_callbacks(proxy_data)):
+                result = set_proxy_session(proxy_path, proxy_data)
+                if not result.get('callback_worker') and _needs_callbacks(proxy_data):
+                    run_plugin(url_for(ROUTE_CALLBACK_WORKER), wait=False)
 
             self.path = get_url(self.path)
             if headers and '|' not in self.path:
@@ -438,5 +466,5 @@ class Item(object):
         return li
 
     def play(self):
-        li = self.get_li()
+        li = self.get_li(play=True)
         xbmc.Player().play(self.path, li)
\ No newline at end of file
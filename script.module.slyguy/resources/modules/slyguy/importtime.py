@@ -0,0 +1,77 @@
+import os
+import sys
+import threading
+from time import time
+
+from six.moves import builtins
+from kodi_six import xbmc
+
+## python -X importtime style profiling through the kodi log ##
+## Enabled with the ADDON_IMPORTTIME=1 environment variable and installed by slyguy/__init__.py before anything else is imported ##
+
+ENABLED = bool(int(os.environ.get('ADDON_IMPORTTIME', '0')))
+
+_original = builtins.__import__
+_local = threading.local()
+_total = 0
+
+def _log(msg):
+    # not using slyguy.log as it's one of the modules being timed
+    xbmc.log('[importtime] {}'.format(msg), xbmc.LOGDEBUG)
+
+def _resolve(name, globals, fromlist, level):
+    if not level or level < 0 or not globals:
+        return [name]
+
+    package = globals.get('__package__') or globals.get('__name__', '')
+    if '__path__' not in globals and not globals.get('__package__'):
+        package = package.rpartition('.')[0]
+
+    base = package.rsplit('.', level - 1)[0]
+    if name:
+        return ['{}.{}'.format(base, name)]
+    elif fromlist:
+        # from . import x, y
+        return ['{}.{}'.format(base, x) for x in fromlist]
+    else:
+        return [base]
+
+def _import(name, globals=None, locals=None, fromlist=(), level=0):
+    global _total
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    names = _resolve(name, globals, fromlist, level)
+    names = [x for x in names if x not in sys.modules] or names
+
+    count = len(sys.modules)
+    stack.append(0)
+    start = time()
+    try:
+        return _original(name, globals, locals, fromlist, level)
+    finally:
+        elapsed = time() - start
+        children = stack.pop()
+
+        # only report calls that actually loaded something
+        if len(sys.modules) != count:
+            if stack:
+                stack[-1] += elapsed
+            else:
+                _total += elapsed
+
+            _log('{:>10} | {:>10} | {}{}'.format(int((elapsed - children) * 1000000), int(elapsed * 1000000), '  ' * len(stack), ', '.join(names)))
+        elif stack:
+            stack[-1] += children
+
+def install():
+    if builtins.__import__ is _import:
+        return
+
+    _log('{:>10} | {:>10} | {}'.format('self [us]', 'cumulative', 'imported package'))
+    builtins.__import__ = _import
+
+def total():
+    return int(_total * 1000)
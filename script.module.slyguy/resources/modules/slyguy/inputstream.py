@@ -5,13 +5,11 @@ import shutil
 import time
 import struct
 import subprocess
-from distutils.version import LooseVersion
 
 from kodi_six import xbmc, xbmcaddon
 
 from . import gui, settings
 from .userdata import Userdata
-from .session import Session
 from .log import log
 from .constants import *
 from .language import _
@@ -173,6 +171,8 @@ def open_settings():
         ia_addon.openSettings()
 
 def require_version(required_version, required=False):
+    from distutils.version import LooseVersion
+
     ia_addon = get_ia_addon(required=required)
     if not ia_addon:
         return False
@@ -185,6 +185,8 @@ def require_version(required_version, required=False):
     return ia_addon if result else False
 
 def install_widevine(reinstall=False):
+    from .session import Session
+
     DST_FILES = {
         'Linux': 'libwidevinecdm.so',
         'Darwin': 'libwidevinecdm.dylib',
@@ -304,6 +306,8 @@ def install_widevine(reinstall=False):
     return True
 
 def _download(url, dst_path, md5=None):
+    from .session import Session
+
     dir_path = os.path.dirname(dst_path)
     if not os.path.exists(dir_path):
         os.makedirs(dir_path)
@@ -166,6 +166,15 @@ class BaseLanguage(object):
     NEW_SEARCH                  = 32126
     REMOVE_SEARCH               = 32127
     NEWS_HEADING                = 32128
+    PROXY_KEEP_ALIVE            = 32129
+    PROXY_WORKERS               = 32130
+    PROXY_PREFETCH              = 32131
+    PROXY_VOD_CACHE             = 32132
+    PROXY_ADAPTIVE_QUALITY      = 32133
+    PROXY_QUALITY_HEADROOM      = 32134
+    PROXY_SEED_BANDWIDTH        = 32135
+    CACHE_MAX_SIZE              = 32136
+    PROXY_SESSION_ERROR         = 32137
 
     def __getattribute__(self, name):
         attr = object.__getattribute__(self, name)
@@ -1,67 +1,196 @@
-import sys
+import os
+import sqlite3
+import hashlib
+import threading
 from time import time
 from functools import wraps
 from copy import deepcopy
 
 from six.moves import cPickle
 
-from . import signals, router
+from . import signals, router, flight
 from .log import log
 from .util import hash_6, set_kodi_string, get_kodi_string
-from .constants import ADDON_ID, CACHE_EXPIRY, ROUTE_CLEAR_CACHE, ADDON_VERSION
+from .constants import ADDON_ID, CACHE_EXPIRY, CACHE_STALE_TIMEOUT, ROUTE_CLEAR_CACHE, ADDON_VERSION, ADDON_DEV, MEM_CACHE_PATH
 from .settings import common_settings as settings
 
 cache_key = 'cache.'+ADDON_ID+ADDON_VERSION
 
+STORE_MARKER = 'store'
+
 class Cache(object):
-    data = {}
+    data  = {}
+    dirty = {}
+    store = None
+    shared = {}
+    lock  = threading.RLock()
 
 cache = Cache()
+refreshing = {}
+
+def _persist():
+    return settings.getBool('persist_cache', True)
+
+def _connect():
+    if cache.store is None:
+        path = os.path.dirname(MEM_CACHE_PATH)
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        store = sqlite3.connect(MEM_CACHE_PATH, timeout=10, check_same_thread=False)
+        store.execute('PRAGMA journal_mode=WAL')
+        store.execute('PRAGMA synchronous=OFF')
+        store.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, expires INTEGER, refresh INTEGER)')
+
+        # the window property goes away with Kodi (or on addon update), so the store should too
+        if get_kodi_string(cache_key) != STORE_MARKER:
+            store.execute('DELETE FROM cache')
+            store.commit()
+            set_kodi_string(cache_key, STORE_MARKER)
 
-@signals.on(signals.BEFORE_DISPATCH)
-def load():
-    if not cache.data and settings.getBool('persist_cache', True):
-        cache.data = {}
+        cache.store = store
 
+    return cache.store
+
+def _close():
+    if cache.store is not None:
+        try: cache.store.close()
+        except: pass
+        cache.store = None
+
+def _load(key):
+    with cache.lock:
         try:
-            data = get_kodi_string(cache_key)
-            cache.data = cPickle.loads(data.encode('latin1'))
+            result = _connect().execute('SELECT value, expires, refresh FROM cache WHERE key = ?', (key,)).fetchone()
         except Exception as e:
-            log.debug('load cache failed')
-        else:
-            log.debug('Cache data loaded')
+            log.debug('Mem Cache: Failed to read {}: {}'.format(key, e))
+            return None
 
-        set_kodi_string(cache_key, "{}")
+    if not result:
+        return None
+
+    try:
+        return [cPickle.loads(bytes(result[0])), result[1], result[2]]
+    except Exception as e:
+        log.debug('Mem Cache: Failed to load {}: {}'.format(key, e))
+        return None
 
-def set(key, value, expires=CACHE_EXPIRY):
+def _flush(now):
+    with cache.lock:
+        try:
+            store = _connect()
+            rows = [(key, sqlite3.Binary(cPickle.dumps(cache.data[key][0], protocol=cPickle.HIGHEST_PROTOCOL)), cache.data[key][1], cache.data[key][2])
+                        for key in cache.dirty if key in cache.data]
+
+            store.executemany('REPLACE INTO cache VALUES (?, ?, ?, ?)', rows)
+            expired = store.execute('DELETE FROM cache WHERE expires < ?', (now,)).rowcount
+            store.commit()
+        except Exception as e:
+            log.debug('Mem Cache: Failed to save: {}'.format(e))
+        else:
+            if expired:
+                log('Mem Cache: Deleted {} Expired Rows'.format(expired))
+        finally:
+            _close()
+            cache.dirty.clear()
+            cache.data.clear()
+
+def _fingerprint(value):
+    return hashlib.md5(cPickle.dumps(value, protocol=cPickle.HIGHEST_PROTOCOL)).hexdigest()
+
+def _track(key, value, name=None):
+    # ADDON_DEV only: remember what copy=False values looked like so mutations can be reported
+    if not ADDON_DEV:
+        return
+
+    if key not in cache.shared:
+        cache.shared[key] = [_fingerprint(value), name or key]
+    elif name:
+        cache.shared[key][1] = name
+
+def _check_mutations():
+    for key in list(cache.shared):
+        fingerprint, name = cache.shared.pop(key)
+        row = cache.data.get(key)
+        if row and _fingerprint(row[0]) != fingerprint:
+            log.warning('Mem Cache: {} value was mutated after being returned with copy=False. Discarding it'.format(name))
+            cache.data.pop(key, None)
+            cache.dirty.pop(key, None)
+
+def set(key, value, expires=CACHE_EXPIRY, stale_ttl=0, copy=True):
     if expires == 0:
         return
 
-    elif expires != None:
-        expires = int(time() + expires)
+    refresh = None
+    if expires != None:
+        refresh = int(time() + expires)
+        expires = refresh + max(stale_ttl, 0)
 
     log('Cache Set: {}'.format(key))
-    cache.data[key] = [deepcopy(value), expires]
+    cache.data[key] = [deepcopy(value) if copy else value, expires, refresh]
+    cache.dirty[key] = True
+
+    cache.shared.pop(key, None)
+    if not copy:
+        _track(key, value)
 
-def get(key, default=None):
+def _get(key, default=None, allow_stale=False, copy=True):
     try:
         row = cache.data[key]
     except KeyError:
-        return default
+        row = _load(key) if _persist() else None
+        if row is None:
+            return default, False
+        cache.data[key] = row
 
-    if row[1] != None and row[1] < time():
+    now = time()
+    if row[1] != None and row[1] < now:
         cache.data.pop(key, None)
-        return default
-    else:
-        log('Cache Hit: {}'.format(key))
-        return deepcopy(row[0])
+        return default, False
+
+    stale = row[2] != None and row[2] < now
+    if stale and not allow_stale:
+        return default, False
+
+    log('Cache {}: {}'.format('Stale Hit' if stale else 'Hit', key))
+    if not copy:
+        _track(key, row[0])
+        return row[0], stale
+
+    return deepcopy(row[0]), stale
+
+def get(key, default=None, copy=True):
+    return _get(key, default, copy=copy)[0]
 
 def delete(key):
-    return int(cache.data.pop(key, None) != None)
+    deleted = cache.data.pop(key, None) != None
+    cache.dirty.pop(key, None)
+
+    if _persist():
+        with cache.lock:
+            try:
+                store = _connect()
+                deleted = store.execute('DELETE FROM cache WHERE key = ?', (key,)).rowcount > 0 or deleted
+                store.commit()
+            except Exception as e:
+                log.debug('Mem Cache: Failed to delete {}: {}'.format(key, e))
+
+    return int(deleted)
 
 def empty():
     deleted = len(cache.data)
     cache.data.clear()
+    cache.dirty.clear()
+
+    if _persist():
+        with cache.lock:
+            try:
+                store = _connect()
+                deleted = max(store.execute('DELETE FROM cache').rowcount, deleted)
+                store.commit()
+            except Exception as e:
+                log.debug('Mem Cache: Failed to empty: {}'.format(e))
+
     log('Mem Cache: Deleted {} Rows'.format(deleted))
 
 def key_for(f, *args, **kwargs):
@@ -96,7 +225,7 @@ def _build_key(func_name, *args, **kwargs):
     return hash_6(key)
 
 def cached(*args, **kwargs):
-    def decorator(f, expires=CACHE_EXPIRY, key=None):
+    def decorator(f, expires=CACHE_EXPIRY, key=None, stale_ttl=0, copy=True):
         @wraps(f)
         def decorated_function(*args, **kwargs):
             _key = key or _build_key(f.__name__, *args, **kwargs)
@@ -104,13 +233,19 @@ def cached(*args, **kwargs):
                 _key = _key(*args, **kwargs)
 
             if not kwargs.pop('_skip_cache', False):
-                value = get(_key)
+                value, stale = _get(_key, None, stale_ttl > 0, copy=copy)
                 if value != None:
+                    if stale:
+                        _refresh(_key, f, args, kwargs, expires, stale_ttl, copy)
+                    if not copy:
+                        _track(_key, value, f.__name__)
                     return value
 
-            value = f(*args, **kwargs)
+            value = flight.run(_key, lambda: f(*args, **kwargs))
             if value != None:
-                set(_key, value, expires)
+                set(_key, value, expires, stale_ttl, copy=copy)
+                if not copy:
+                    _track(_key, value, f.__name__)
 
             return value
 
@@ -118,13 +253,41 @@ def cached(*args, **kwargs):
 
     return lambda f: decorator(f, *args, **kwargs)
 
+def _refresh(key, f, args, kwargs, expires, stale_ttl, copy=True):
+    if key in refreshing:
+        return
+
+    def worker():
+        try:
+            value = flight.run(key, lambda: f(*args, **kwargs))
+            if value != None:
+                set(key, value, expires, stale_ttl, copy=copy)
+        except Exception as e:
+            log.debug('Mem Cache: Refresh of {} failed'.format(key))
+            log.exception(e)
+
+    thread = threading.Thread(target=worker)
+    thread.daemon = True
+    thread.start()
+    refreshing[key] = thread
+
 @signals.on(signals.AFTER_DISPATCH)
 def remove_expired():
+    # refreshes need to land before the cache is persisted
+    for key in list(refreshing):
+        refreshing.pop(key).join(CACHE_STALE_TIMEOUT)
+
+    _check_mutations()
+
     _time = time()
+    if _persist():
+        _flush(_time)
+        return
+
     delete  = []
 
     for key in cache.data.keys():
-        if cache.data[key][1] < _time:
+        if cache.data[key][1] != None and cache.data[key][1] < _time:
             delete.append(key)
 
     for key in delete:
@@ -133,10 +296,6 @@ def remove_expired():
     if delete:
         log('Mem Cache: Deleted {} Expired Rows'.format(len(delete)))
 
-    if settings.getBool('persist_cache', True):
-        set_kodi_string(cache_key, cPickle.dumps(cache.data, protocol=0).decode('latin1'))
-        cache.data.clear()
-
 @router.route(ROUTE_CLEAR_CACHE)
 def clear_cache(key, **kwargs):
     delete_count = delete(key)
\ No newline at end of file
@@ -5,17 +5,15 @@ import random
 import time
 import json
 from functools import wraps
-from six.moves.urllib_parse import quote_plus
+from six.moves.urllib_parse import quote_plus, urlparse
 
-from pycaption import detect_format, WebVTTWriter
 from kodi_six import xbmc, xbmcplugin
 from six.moves.urllib.parse import quote
 
-from . import router, gui, settings, userdata, inputstream, signals, migrate, bookmarks
+from . import router, gui, settings, userdata, inputstream, signals, migrate, bookmarks, callbacks, ttml, importtime
 from .constants import *
 from .log import log
 from .language import _
-from .session import Session
 from .exceptions import Error, PluginError, FailedPlayback
 from .util import set_kodi_string, get_addon, remove_file, user_country
 
@@ -87,25 +85,33 @@ def route(url=None):
 # @plugin.plugin_callback()
 def plugin_callback():
     def decorator(func):
-        @wraps(func)
-        def decorated_function(*args, **kwargs):
-            with open(kwargs['_data_path'], 'rb') as f:
-                kwargs['_data'] = f.read()
+        def run_callback(*args, **kwargs):
+            if '_data' not in kwargs:
+                with open(kwargs['_data_path'], 'rb') as f:
+                    kwargs['_data'] = f.read()
+
+                remove_file(kwargs['_data_path'])
 
-            remove_file(kwargs['_data_path'])
             kwargs['_headers'] = json.loads(kwargs['_headers'])
 
             try:
-                path = func(*args, **kwargs)
+                return func(*args, **kwargs)
             except Exception as e:
                 log.exception(e)
-                path = None
+                return None
+
+        @wraps(func)
+        def decorated_function(*args, **kwargs):
+            path = run_callback(*args, **kwargs)
 
             folder = Folder(show_news=False)
             folder.add_item(
                 path = quote_plus(path or ''),
             )
             return folder
+
+        # lets the callback worker call it directly without building a folder
+        decorated_function._plugin_callback = run_callback
         return decorated_function
     return lambda func: decorator(func)
 
@@ -309,6 +315,11 @@ def reboot():
     _close()
     xbmc.executebuiltin('Reboot')
 
+@signals.on(signals.BEFORE_DISPATCH)
+def _import_time():
+    if importtime.ENABLED:
+        log.debug('Import Time: {}ms'.format(importtime.total()))
+
 @signals.on(signals.AFTER_DISPATCH)
 def _close():
     signals.emit(signals.ON_CLOSE)
@@ -322,17 +333,49 @@ def _settings(**kwargs):
 @route(ROUTE_WEBVTT)
 @plugin_callback()
 def _webvtt(url, _data_path, _headers, **kwargs):
+    # pycaption (and bs4) are slow to import and only needed here
+    from pycaption import detect_format, WebVTTWriter, DFXPReader
+    from .session import Session
+
     r = Session().get(url, headers=_headers)
 
     data = r.content.decode('utf8')
     reader = detect_format(data)
 
-    data = WebVTTWriter().write(reader().read(data))
+    webvtt = None
+    if reader is DFXPReader:
+        try:
+            webvtt = ttml.to_webvtt(data)
+        except ttml.TTMLError as e:
+            log.debug('TTML fallback to pycaption: {}'.format(e))
+
+    data = webvtt or WebVTTWriter().write(reader().read(data))
+
     with open(_data_path, 'wb') as f:
         f.write(data.encode('utf8'))
 
     return _data_path + '|content-type=text/vtt'
 
+@route(ROUTE_CALLBACK_WORKER)
+def _callback_worker(**kwargs):
+    def handler(url, data):
+        # each callback is its own dispatch so settings, caches and the db don't go stale for the life of the worker
+        signals.emit(signals.BEFORE_DISPATCH)
+
+        try:
+            function, params = router.parse_url('?' + urlparse(url).query)
+
+            callback = getattr(function, '_plugin_callback', None)
+            if not callback:
+                raise PluginError('Not a plugin callback: {}'.format(url))
+
+            params['_data'] = data
+            return callback(**params)
+        finally:
+            signals.emit(signals.AFTER_DISPATCH)
+
+    callbacks.run_worker(handler)
+
 @route(ROUTE_RESET)
 def _reset(**kwargs):
     if not gui.yes_no(_.PLUGIN_RESET_YES_NO):
@@ -496,7 +539,7 @@ class Item(gui.Item):
 
         self.proxy_data['quality'] = quality
 
-        li = self.get_li()
+        li = self.get_li(play=True)
         handle = _handle()
 
         if self.play_next:
@@ -29,13 +29,13 @@ orig_getaddrinfo = socket.getaddrinfo
 class RawSession(requests.Session):
     def __init__(self):
         super(RawSession, self).__init__()
-        self._dns_rewrites = []
-        self._rewrite_cache = {}
-        socket.getaddrinfo = lambda *args, **kwargs: self._getaddrinfoPreferIPv4(*args, **kwargs)
+        self.set_dns_rewrites([])
 
     def set_dns_rewrites(self, rewrites):
         self._dns_rewrites = rewrites
         self._rewrite_cache = {}
+        # getaddrinfo is process wide, so (re)claim it for this session
+        socket.getaddrinfo = lambda *args, **kwargs: self._getaddrinfoPreferIPv4(*args, **kwargs)
 
     def _getaddrinfoPreferIPv4(self, host, port, family=0, _type=0, proto=0, flags=0):
         if host in self._rewrite_cache:
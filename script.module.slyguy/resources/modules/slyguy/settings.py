@@ -1,5 +1,6 @@
 import json
 import os
+from xml.etree import ElementTree
 
 from kodi_six import xbmc, xbmcaddon
 
@@ -10,14 +11,22 @@ from .util import remove_file
 
 @signals.on(signals.BEFORE_DISPATCH)
 def before_dispatch():
-    #refresh settings
-    global ADDON
-    ADDON = xbmcaddon.Addon(ADDON.getAddonInfo('id'))
-    check_corrupt(ADDON)
+    #read settings once per dispatch
+    addon_settings.snapshot(True)
+    common_settings.snapshot(True)
+
+@signals.on(signals.AFTER_DISPATCH)
+def after_dispatch():
+    addon_settings.snapshot(False)
+    common_settings.snapshot(False)
+
+@signals.on(signals.ON_SETTINGS_CHANGED)
+def settings_changed():
+    addon_settings.reset()
     common_settings.reset()
 
 def open():
-    ADDON.openSettings()
+    addon_settings.open()
 
 def getDict(key, default=None):
     try:
@@ -67,18 +76,50 @@ def setBool(key, value=True):
     set(key, 'true' if value else 'false')
 
 def get(key, default=''):
-    return ADDON.getSetting(key) or default
+    return addon_settings.get(key, default)
 
 def set(key, value=''):
-    ADDON.setSetting(key, str(value))
+    addon_settings.set(key, value)
 
 class Settings(object):
     def __init__(self, _addon=None):
         self._addon = _addon or ADDON
+        self._id = self._addon.getAddonInfo('id')
+        self._path = os.path.join(xbmc.translatePath(self._addon.getAddonInfo('profile')), 'settings.xml')
+        self._snapshot = False
+        self._values = None
         check_corrupt(self._addon)
 
+    def _get_addon(self):
+        if self._addon is None:
+            self._addon = xbmcaddon.Addon(self._id)
+
+        return self._addon
+
+    def _load(self):
+        values = {}
+
+        try:
+            for elem in ElementTree.parse(self._path).getroot().iter('setting'):
+                if elem.get('id'):
+                    # v1 uses a value attribute, v2 (Kodi 18+) the element text
+                    values[elem.get('id')] = elem.get('value') if 'value' in elem.attrib else (elem.text or '')
+        except Exception as e:
+            log.debug('Failed to read {}: {}'.format(self._path, e))
+
+        if values.get('_fresh') != 'false' and self._id == ADDON_ID:
+            check_corrupt(self._get_addon())
+            values = {}
+
+        return values
+
+    def snapshot(self, enabled=True):
+        self._snapshot = enabled
+        self.reset()
+
     def open(self):
-        self._addon.openSettings()
+        self._get_addon().openSettings()
+        self.reset()
 
     def getDict(self, key, default=None):
         try:
@@ -87,7 +128,8 @@ class Settings(object):
             return default
 
     def reset(self):
-        self._addon = xbmcaddon.Addon(self._addon.getAddonInfo('id'))
+        self._addon = None
+        self._values = None
 
     def setDict(self, key, value):
         self.set(key, json.dumps(value, separators=(',', ':')))
@@ -131,10 +173,27 @@ class Settings(object):
         self.set(key, 'true' if value else 'false')
 
     def get(self, key, default=''):
-        return self._addon.getSetting(key) or default
+        if not self._snapshot:
+            return self._get_addon().getSetting(key) or default
+
+        if self._values is None:
+            self._values = self._load()
+
+        try:
+            value = self._values[key]
+        except KeyError:
+            value = self._values[key] = self._get_addon().getSetting(key)
+
+        return value or default
 
     def set(self, key, value=''):
-        self._addon.setSetting(key, str(value))
+        value = str(value)
+        if self._values is not None and self._values.get(key) == value:
+            return
+
+        self._get_addon().setSetting(key, value)
+        if self._values is not None:
+            self._values[key] = value
 
 def check_corrupt(addon):
     if addon.getAddonInfo('id') != ADDON_ID:
@@ -154,4 +213,5 @@ def check_corrupt(addon):
         addon = xbmcaddon.Addon(addon.getAddonInfo('id'))
         addon.setSetting('_fresh', 'false')
 
+addon_settings = Settings(ADDON)
 common_settings = Settings(COMMON_ADDON)
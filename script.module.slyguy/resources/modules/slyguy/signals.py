@@ -13,6 +13,7 @@ AFTER_DISPATCH  = 'after_dispatch'
 ON_ERROR        = 'on_error'
 ON_EXCEPTION    = 'on_exception'
 ON_CLOSE        = 'on_close'
+ON_SETTINGS_CHANGED = 'on_settings_changed'
 
 def on(signal):
     def decorator(f):
@@ -0,0 +1,353 @@
+import re
+from xml.parsers import expat
+
+## Streaming TTML / DFXP -> WebVTT for the common timing, styling and region subset ##
+## Raises TTMLError for anything it can't handle so callers can fall back to pycaption ##
+
+CLOCK_RE = re.compile(r'^(\d+):(\d{2}):(\d{2})(?:(\.\d+)|:(\d{2,})(?:\.(\d+))?)?$')
+OFFSET_RE = re.compile(r'^(\d+(?:\.\d+)?)(h|ms|m|s|f|t)$')
+PERCENT_RE = re.compile(r'^(-?\d+(?:\.\d+)?)%\s+(-?\d+(?:\.\d+)?)%$')
+PIXEL_RE = re.compile(r'^(-?\d+(?:\.\d+)?)px\s+(-?\d+(?:\.\d+)?)px$')
+WHITESPACE_RE = re.compile(r'\s+')
+SPACES_RE = re.compile(r' {2,}')
+
+ALIGNMENTS = {'left': 'left', 'right': 'right', 'start': 'start', 'end': 'end'}
+STYLE_TAGS = [('bold', '<b>', '</b>'), ('italics', '<i>', '</i>'), ('underline', '<u>', '</u>')]
+TIMED_TAGS = ('body', 'div', 'p')
+SKIP_TAGS = ('metadata', 'set', 'image', 'information')
+
+class TTMLError(Exception):
+    pass
+
+def _local(name):
+    return name.rsplit(' ', 1)[-1]
+
+def _attribs(attrs):
+    return dict((_local(key), value) for key, value in attrs.items())
+
+def _text_styles(attrs):
+    styles = {}
+
+    if 'fontStyle' in attrs:
+        styles['italics'] = attrs['fontStyle'] in ('italic', 'oblique')
+    if 'fontWeight' in attrs:
+        styles['bold'] = attrs['fontWeight'] == 'bold'
+    if 'textDecoration' in attrs:
+        styles['underline'] = 'underline' in attrs['textDecoration'] and 'noUnderline' not in attrs['textDecoration']
+    if 'textAlign' in attrs:
+        styles['align'] = ALIGNMENTS.get(attrs['textAlign'])
+
+    return styles
+
+def _escape(text):
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+def _timestamp(seconds):
+    ms = int(round(seconds * 1000))
+    hh, ms = divmod(ms, 3600000)
+    mm, ms = divmod(ms, 60000)
+    ss, ms = divmod(ms, 1000)
+    return '{:02d}:{:02d}:{:02d}.{:03d}'.format(hh, mm, ss, ms)
+
+class _Converter(object):
+    def __init__(self):
+        self._frame_rate = 30.0
+        self._sub_frame_rate = 1
+        self._tick_rate = 1
+        self._extent = None
+
+        self._styles = {}
+        self._regions = {}
+        self._stack = []
+        self._skip = 0
+        self._cue = None
+        self._cues = []
+
+        self._definition = None
+
+    def parse(self, text):
+        parser = expat.ParserCreate(namespace_separator=' ')
+        parser.StartElementHandler = self._start
+        parser.EndElementHandler = self._end
+        parser.CharacterDataHandler = self._data
+
+        try:
+            parser.Parse(text.encode('utf8') if not isinstance(text, bytes) else text, True)
+        except expat.ExpatError as e:
+            raise TTMLError('XML error: {}'.format(e))
+        except (ValueError, TypeError, KeyError, ZeroDivisionError) as e:
+            # bad attribute values (frameRate="x" etc) raised from inside the handlers
+            raise TTMLError('Invalid document: {}'.format(e))
+
+        return self._cues
+
+    ## Time ##
+    def _root(self, attrs):
+        if attrs.get('timeBase', 'media') != 'media':
+            raise TTMLError('Unsupported timeBase: {}'.format(attrs['timeBase']))
+
+        if 'frameRate' in attrs:
+            self._frame_rate = float(attrs['frameRate'])
+            if 'frameRateMultiplier' in attrs:
+                numerator, denominator = attrs['frameRateMultiplier'].split()
+                self._frame_rate = self._frame_rate * float(numerator) / float(denominator)
+
+        self._sub_frame_rate = int(attrs.get('subFrameRate', 1))
+
+        if 'tickRate' in attrs:
+            self._tick_rate = float(attrs['tickRate'])
+        elif 'frameRate' in attrs:
+            self._tick_rate = self._frame_rate * self._sub_frame_rate
+
+        if 'extent' in attrs:
+            match = PIXEL_RE.match(attrs['extent'].strip())
+            if match:
+                self._extent = (float(match.group(1)), float(match.group(2)))
+
+    def _time(self, value):
+        value = value.strip()
+
+        match = CLOCK_RE.match(value)
+        if match:
+            hours, minutes, seconds, fraction, frames, sub_frames = match.groups()
+            total = int(hours) * 3600 + int(minutes) * 60 + int(seconds)
+            if fraction:
+                total += float(fraction)
+            if frames:
+                total += (int(frames) + (int(sub_frames) / float(self._sub_frame_rate) if sub_frames else 0)) / self._frame_rate
+            return total
+
+        match = OFFSET_RE.match(value)
+        if match:
+            number, metric = float(match.group(1)), match.group(2)
+            if metric == 'h':
+                return number * 3600
+            elif metric == 'm':
+                return number * 60
+            elif metric == 's':
+                return number
+            elif metric == 'ms':
+                return number / 1000
+            elif metric == 'f':
+                return number / self._frame_rate
+            else:
+                return number / self._tick_rate
+
+        raise TTMLError('Unsupported time expression: {}'.format(value))
+
+    def _timing(self, attrs, parent):
+        parent_begin = parent['begin'] if parent else 0
+        parent_end = parent['end'] if parent else None
+
+        if attrs.get('timeContainer', 'par') != 'par':
+            raise TTMLError('Unsupported timeContainer: {}'.format(attrs['timeContainer']))
+
+        begin = parent_begin + self._time(attrs['begin']) if 'begin' in attrs else parent_begin
+
+        if 'end' in attrs:
+            end = parent_begin + self._time(attrs['end'])
+        elif 'dur' in attrs:
+            end = begin + self._time(attrs['dur'])
+        else:
+            end = parent_end
+
+        if parent_end is not None and end is not None:
+            end = min(end, parent_end)
+
+        return begin, end
+
+    ## Styling ##
+    def _resolve_style(self, attrs, seen=None):
+        styles = {}
+
+        seen = seen or set()
+        for style_id in attrs.get('style', '').split():
+            if style_id in seen:
+                continue
+
+            seen.add(style_id)
+            style = self._styles.get(style_id)
+            if style:
+                styles.update(self._resolve_style(style, seen))
+
+        styles.update(_text_styles(attrs))
+        return styles
+
+    def _position(self, region_id):
+        region = self._regions.get(region_id)
+        if not region:
+            return ''
+
+        def percent(value):
+            value = value.strip()
+
+            match = PERCENT_RE.match(value)
+            if match:
+                return float(match.group(1)), float(match.group(2))
+
+            match = PIXEL_RE.match(value)
+            if match and self._extent:
+                return float(match.group(1)) * 100 / self._extent[0], float(match.group(2)) * 100 / self._extent[1]
+
+            return None
+
+        origin = percent(region['origin']) if 'origin' in region else None
+        extent = percent(region['extent']) if 'extent' in region else None
+
+        settings = ''
+        if origin:
+            left, top = [min(max(x, 0), 100) for x in origin]
+            if left:
+                settings += ' position:{}%,start'.format(_number(left))
+            if top:
+                settings += ' line:{}%'.format(_number(top))
+
+            if extent:
+                width = min(extent[0], 100 - left)
+                if width:
+                    settings += ' size:{}%'.format(_number(width))
+
+        return settings
+
+    ## Handlers ##
+    def _start(self, name, attrs):
+        tag = _local(name)
+        attrs = _attribs(attrs)
+
+        if self._skip or tag in SKIP_TAGS:
+            self._skip += 1
+            return
+
+        parent = self._stack[-1] if self._stack else None
+
+        if tag == 'tt':
+            self._root(attrs)
+            self._stack.append({'tag': tag, 'begin': 0, 'end': None, 'styles': {}, 'region': None})
+            return
+
+        if tag == 'style' and parent and parent['tag'] in ('styling', 'region'):
+            if parent['tag'] == 'region':
+                self._definition.update(attrs)
+            elif 'id' in attrs:
+                self._styles[attrs['id']] = attrs
+            self._stack.append({'tag': tag})
+            return
+
+        if tag == 'region' and parent and parent['tag'] == 'layout':
+            self._definition = dict(attrs)
+            self._regions[attrs.get('id')] = self._definition
+            self._stack.append({'tag': tag})
+            return
+
+        if tag in ('head', 'styling', 'layout'):
+            self._stack.append({'tag': tag})
+            return
+
+        if parent and parent['tag'] in ('head', 'styling', 'layout', 'region', 'style'):
+            # ttm:title, ttm:copyright etc
+            self._skip += 1
+            return
+
+        if tag in ('br', 'span') and self._cue is None:
+            raise TTMLError('Inline {} outside of p'.format(tag))
+
+        if tag == 'br':
+            self._cue['text'].append('\n')
+            self._stack.append({'tag': tag})
+            return
+
+        if tag not in TIMED_TAGS and tag != 'span':
+            raise TTMLError('Unsupported element: {}'.format(tag))
+
+        if tag == 'span' and ('begin' in attrs or 'end' in attrs or 'dur' in attrs):
+            raise TTMLError('Timed spans are not supported')
+
+        if self._cue is not None and tag != 'span':
+            raise TTMLError('Nested {} inside p'.format(tag))
+
+        styles = dict(parent.get('styles') or {})
+        region_id = attrs.get('region') or parent.get('region')
+        if tag != 'span' and region_id in self._regions:
+            styles.update(self._resolve_style(self._regions[region_id]))
+        styles.update(self._resolve_style(attrs))
+
+        if tag == 'span':
+            element = {'tag': tag, 'styles': styles, 'region': region_id}
+            element['tags'] = self._open_tags(parent['styles'], styles)
+            self._cue['text'].append(''.join(x[1] for x in element['tags']))
+        else:
+            begin, end = self._timing(attrs, parent)
+            element = {'tag': tag, 'begin': begin, 'end': end, 'styles': styles, 'region': region_id}
+
+        if tag == 'p':
+            if end is None:
+                raise TTMLError('Cue without an end time')
+
+            self._cue = {'begin': begin, 'end': end, 'text': [], 'styles': styles, 'region': region_id}
+
+        self._stack.append(element)
+
+    def _open_tags(self, parent_styles, styles):
+        return [tag for tag in STYLE_TAGS if styles.get(tag[0]) and not parent_styles.get(tag[0])]
+
+    def _end(self, name):
+        if self._skip:
+            self._skip -= 1
+            return
+
+        element = self._stack.pop()
+
+        if element['tag'] == 'span':
+            self._cue['text'].append(''.join(x[2] for x in reversed(element['tags'])))
+
+        elif element['tag'] == 'p':
+            self._add_cue(self._cue)
+            self._cue = None
+
+        elif element['tag'] == 'region':
+            self._definition = None
+
+    def _data(self, data):
+        if self._skip or self._cue is None:
+            return
+
+        self._cue['text'].append(_escape(WHITESPACE_RE.sub(' ', data)))
+
+    def _add_cue(self, cue):
+        lines = [SPACES_RE.sub(' ', x).strip() for x in ''.join(cue['text']).split('\n')]
+        text = '\n'.join(x for x in lines if x)
+        if not text or cue['end'] <= cue['begin']:
+            return
+
+        styles = cue['styles']
+        open_tags = ''.join(x[1] for x in STYLE_TAGS if styles.get(x[0]))
+        close_tags = ''.join(x[2] for x in reversed(STYLE_TAGS) if styles.get(x[0]))
+
+        settings = ''
+        if styles.get('align'):
+            settings += ' align:{}'.format(styles['align'])
+        settings += self._position(cue['region'])
+
+        self._cues.append((cue['begin'], cue['end'], settings, open_tags + text + close_tags))
+
+def _number(value):
+    value = round(value, 2)
+    if value == int(value):
+        return str(int(value))
+
+    return '{:.2f}'.format(value).rstrip('0').rstrip('.')
+
+def to_webvtt(text):
+    cues = _Converter().parse(text)
+    cues.sort(key=lambda x: (x[0], x[1]))
+
+    output = ['WEBVTT\n']
+    for i, cue in enumerate(cues):
+        # merge cues sharing the same timing into one block
+        if i > 0 and cues[i-1][0] == cue[0] and cues[i-1][1] == cue[1] and cues[i-1][2] == cue[2]:
+            output.append(cue[3] + '\n')
+            continue
+
+        output.append(u'\n{} --> {}{}\n{}\n'.format(_timestamp(cue[0]), _timestamp(cue[1]), cue[2], cue[3]))
+
+    return u''.join(output)
@@ -1,64 +1,156 @@
-from . import settings
-from .constants import ADDON, USERDATA_KEY
-
-def _get_data():
-    return settings.getDict(USERDATA_KEY, {})
-
-def get(key, default=None):
-    return _get_data().get(key, default)
-
-def set(key, value):
-    data = _get_data()
-    data[key] = value
-    _set_data(data)
-
-def _set_data(data):
-    settings.setDict(USERDATA_KEY, data)
-
-def pop(key, default=None):
-    data = _get_data()
-    value = data.pop(key, default)
-    _set_data(data)
-    return value
-
-def delete(key):
-    data = _get_data()
-    if key in data:
-        del data[key]
-        _set_data(data)
-    
-def clear():
-    _set_data({})
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from kodi_six import xbmc
+
+from . import settings, signals
+from .log import log
+from .constants import ADDON, USERDATA_KEY, USERDATA_FILE
 
 class Userdata(object):
     def __init__(self, _addon=None):
-        self._settings = settings.Settings(_addon or ADDON)
+        addon = _addon or ADDON
+        self._settings = settings.addon_settings if addon is ADDON else settings.Settings(addon)
+        self._path = os.path.join(xbmc.translatePath(addon.getAddonInfo('profile')), USERDATA_FILE)
+        self._lock = threading.RLock()
+        self._conn = None
+        self._version = None
+        self._data = None
+        self._batch = None
+
+    def _connect(self):
+        if self._conn is None:
+            path = os.path.dirname(self._path)
+            if not os.path.exists(path):
+                os.makedirs(path)
+
+            conn = sqlite3.connect(self._path, timeout=10, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS userdata (key TEXT PRIMARY KEY, value TEXT)')
+            conn.commit()
+
+            self._conn = conn
+            self._migrate()
+
+        return self._conn
+
+    def _migrate(self):
+        # move the old single json blob setting into the keyed store
+        data = self._settings.getDict(USERDATA_KEY, {})
+        if not data:
+            return
+
+        self._conn.executemany('INSERT OR IGNORE INTO userdata VALUES (?, ?)', [(key, json.dumps(data[key])) for key in data])
+        self._conn.commit()
+        self._settings.setDict(USERDATA_KEY, {})
+        log.debug('Userdata: Migrated {} keys'.format(len(data)))
 
     def _get_data(self):
-        return self._settings.getDict(USERDATA_KEY, {})
+        with self._lock:
+            conn = self._connect()
 
-    def get(self, key, default=None):
-        return self._get_data().get(key, default)
+            # data_version changes when another connection (process) commits
+            version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if self._data is None or version != self._version:
+                self._data = dict(conn.execute('SELECT key, value FROM userdata').fetchall())
+                self._version = version
 
-    def set(self, key, value):
+                for key, value in (self._batch or {}).items():
+                    if value is None:
+                        self._data.pop(key, None)
+                    else:
+                        self._data[key] = value
+
+            return self._data
+
+    def _write(self, rows):
+        if not rows:
+            return
+
+        with self._lock:
+            conn = self._connect()
+            conn.executemany('REPLACE INTO userdata VALUES (?, ?)', [(key, rows[key]) for key in rows if rows[key] is not None])
+            conn.executemany('DELETE FROM userdata WHERE key = ?', [(key,) for key in rows if rows[key] is None])
+            conn.commit()
+
+    def _store(self, key, value):
+        with self._lock:
+            data = self._get_data()
+            if data.get(key) == value:
+                return
+
+            if value is None:
+                data.pop(key, None)
+            else:
+                data[key] = value
+
+            if self._batch is not None:
+                self._batch[key] = value
+            else:
+                self._write({key: value})
+
+    @contextmanager
+    def batch(self):
+        if self._batch is not None:
+            yield
+            return
+
+        self._batch = {}
+        try:
+            yield
+        finally:
+            rows, self._batch = self._batch, None
+            self._write(rows)
+
+    def get(self, key, default=None):
         data = self._get_data()
-        data[key] = value
-        self._set_data(data)
+        if key not in data:
+            return default
+
+        # a stored None comes back as None, not the default
+        return json.loads(data[key])
 
-    def _set_data(self, data):
-        self._settings.setDict(USERDATA_KEY, data)
+    def set(self, key, value):
+        self._store(key, json.dumps(value, separators=(',', ':')))
 
     def pop(self, key, default=None):
-        data = self._get_data()
-        value = data.pop(key, default)
-        self._set_data(data)
+        value = self.get(key, default)
+        self.delete(key)
         return value
 
     def delete(self, key):
-        data = self._get_data()
-        if key in data:
-            del data[key]
-            self._set_data(data)
-        
+        self._store(key, None)
+
     def clear(self):
-        self._set_data({})
\ No newline at end of file
+        with self._lock:
+            conn = self._connect()
+            conn.execute('DELETE FROM userdata')
+            conn.commit()
+            self._data = None
+            if self._batch is not None:
+                self._batch.clear()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = None
+            self._data = None
+
+_userdata = Userdata()
+
+get    = _userdata.get
+set    = _userdata.set
+pop    = _userdata.pop
+delete = _userdata.delete
+clear  = _userdata.clear
+batch  = _userdata.batch
+
+# closed before a reset removes the profile folder (open WAL files block that on Windows)
+@signals.on(signals.ON_CLOSE)
+@signals.on(signals.AFTER_RESET)
+def reset():
+    _userdata.close()
@@ -17,7 +17,6 @@ from kodi_six import xbmc, xbmcgui, xbmcaddon, xbmcvfs
 from six.moves import queue
 from six.moves.urllib.parse import urlparse, urlunparse
 from six import PY2
-import requests
 
 from .language import _
 from .log import log
@@ -32,6 +31,16 @@ def run_plugin(path, wait=False):
         xbmc.executebuiltin('RunPlugin({})'.format(path))
         return [], []
 
+def proxy_post(url, data, timeout=5):
+    from six.moves.urllib.request import Request, urlopen
+
+    request = Request(url, data=json.dumps(data).encode('utf8'), headers={'Content-Type': 'application/json'})
+
+    with closing(urlopen(request, timeout=timeout)) as response:
+        body = response.read()
+
+    return json.loads(body.decode('utf8')) if body else {}
+
 def fix_url(url):
     parse = urlparse(url)
     parse = parse._replace(path=re.sub('/{2,}','/',parse.path))
@@ -177,6 +186,8 @@ def require_country(required=None, _raise=False):
     return ''
 
 def user_country():
+    import requests
+
     try:
         country = requests.get('http://ip-api.com/json/?fields=countryCode').json()['countryCode'].upper()
         log.debug('fetched user country: {}'.format(country))
@@ -208,6 +219,7 @@ def gdrivedl(url, dst_path):
     if not id:
         raise Error('No file ID find in gdrive url')
 
+    import requests
     session = requests.session()
     resp = session.get(FILE_URL.format(id=id, confirm=''), stream=True)
     if not resp.ok:
@@ -0,0 +1,52 @@
+import time
+import xml.etree.ElementTree as ET
+from xml.dom.minidom import parseString
+
+import conftest
+from test_dash import parse_dash, SESSIONS
+from resources.lib import proxy
+
+## python tests/bench_dash.py - minidom vs ElementTree on a long SegmentList / SegmentTimeline VOD manifest ##
+
+REPRESENTATIONS = 6
+SEGMENTS = 5000
+ROUNDS = 3
+
+def manifest():
+    xml = ['<?xml version="1.0"?><MPD xmlns="urn:mpeg:dash:schema:mpd:2011" xmlns:cenc="urn:mpeg:cenc:2013" type="static" mediaPresentationDuration="PT3H"><Period>']
+    xml.append('<BaseURL>https://cdn.example.com/vod/</BaseURL><AdaptationSet mimeType="video/mp4">')
+    xml.append('<ContentProtection schemeIdUri="urn:mpeg:dash:mp4protection:2011" value="cenc" cenc:default_KID="1"/>')
+    for i in range(REPRESENTATIONS):
+        xml.append('<Representation id="v{0}" bandwidth="{1}" width="{2}" height="{3}" codecs="avc1.64001f"><SegmentList timescale="1000" duration="2000">'.format(i, (i+1)*1000000, 640+i*256, 360+i*144))
+        xml.extend('<SegmentURL media="v{}/{}.m4s"/>'.format(i, x) for x in range(SEGMENTS))
+        xml.append('</SegmentList></Representation>')
+    xml.append('</AdaptationSet><AdaptationSet mimeType="audio/mp4" lang="en"><SegmentTemplate timescale="48000" media="a/$Time$.m4s" initialization="a/init.mp4"><SegmentTimeline>')
+    xml.extend('<S t="{}" d="96000"/>'.format(x * 96000) for x in range(SEGMENTS * 4))
+    xml.append('</SegmentTimeline></SegmentTemplate><Representation id="a" bandwidth="128000"/></AdaptationSet></Period></MPD>')
+    return ''.join(xml).encode('utf8')
+
+def timed(func, data):
+    best = None
+    for i in range(ROUNDS):
+        start = time.time()
+        func(data)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def main():
+    data = manifest()
+    print('manifest: {:.1f}MB'.format(len(data) / 1024.0 / 1024.0))
+
+    results = [
+        ['minidom parse + toxml', timed(lambda x: parseString(x).toxml('utf-8'), data)],
+        ['ElementTree parse + tostring', timed(lambda x: ET.tostring(proxy._parse_xml(x), encoding='utf-8'), data)],
+        ['_parse_dash (best quality)', timed(lambda x: parse_dash(x, SESSIONS['best']), data)],
+    ]
+
+    for label, seconds in results:
+        print('{:<30} {:>8.3f}s'.format(label, seconds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+import time
+import threading
+
+import conftest
+from six.moves import http_client
+from six.moves.BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from six.moves.socketserver import ThreadingMixIn
+from resources.lib import proxy
+
+## python tests/bench_relay.py - proxy relay throughput, readinto + sendfile path vs the raw.read chunk path ##
+
+CHUNK = b'x' * (1024*1024)
+CHUNKS = 200
+ROUNDS = 3
+
+class Upstream(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        return
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header('content-length', str(len(CHUNK) * CHUNKS))
+        self.end_headers()
+        for i in range(CHUNKS):
+            self.wfile.write(CHUNK)
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+def fetch(url):
+    conn = http_client.HTTPConnection(proxy.HOST, proxy.PORT)
+    conn.request('GET', '/' + url)
+    response = conn.getresponse()
+
+    total = 0
+    while True:
+        data = response.read(1024*1024)
+        if not data:
+            break
+        total += len(data)
+
+    conn.close()
+    return total
+
+def timed(url):
+    start = time.time()
+    total = sum(fetch(url) for i in range(ROUNDS))
+    return total / (time.time() - start) / 1024 / 1024
+
+def main():
+    upstream = Server((proxy.HOST, 0), Upstream)
+    thread = threading.Thread(target=upstream.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://{}:{}/segment.ts'.format(proxy.HOST, upstream.server_address[1])
+
+    server = proxy.Proxy()
+    server.start()
+    try:
+        relay = timed(url)
+
+        _relay = proxy.ResponseStream.relay
+        proxy.ResponseStream.relay = proxy.ResponseStream._relay_chunks
+        try:
+            chunks = timed(url)
+        finally:
+            proxy.ResponseStream.relay = _relay
+    finally:
+        server.stop()
+        upstream.shutdown()
+
+    print('{:<20} {:>8.0f} MB/s'.format('readinto relay', relay))
+    print('{:<20} {:>8.0f} MB/s'.format('raw.read chunks', chunks))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,35 @@
+import time
+
+import conftest
+from test_ttml import sample, pycaption_webvtt
+from slyguy import ttml
+
+## python tests/bench_ttml.py - TTML -> WebVTT with ttml.py vs pycaption DFXPReader + WebVTTWriter ##
+
+CUES = 500
+ROUNDS = 3
+
+def timed(func, data):
+    best = None
+    for i in range(ROUNDS):
+        start = time.time()
+        func(data)
+        elapsed = time.time() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+def main():
+    data = sample(CUES)
+    print('document: {} cues, {:.1f}KB'.format(CUES, len(data) / 1024.0))
+
+    results = [
+        ['pycaption', timed(pycaption_webvtt, data)],
+        ['ttml.to_webvtt', timed(ttml.to_webvtt, data)],
+    ]
+
+    for label, seconds in results:
+        print('{:<30} {:>8.3f}s'.format(label, seconds))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+import os
+import sys
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [os.path.dirname(os.path.abspath(__file__)), os.path.join(ADDON_DIR, 'resources', 'modules'), ADDON_DIR]
+
+import kodi_stubs
+kodi_stubs.install()
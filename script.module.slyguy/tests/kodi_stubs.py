@@ -0,0 +1,97 @@
+import os
+import sys
+import types
+import tempfile
+
+## Just enough of the Kodi python API to import slyguy and the proxy outside of Kodi ##
+
+ROOT = tempfile.mkdtemp(prefix='slyguy-tests-')
+
+def _translate_path(path):
+    if path.startswith('special://'):
+        path = os.path.join(ROOT, path[len('special://'):])
+
+    return path
+
+class _Addon(object):
+    _settings = {}
+
+    def __init__(self, id=''):
+        self._id = id or 'plugin.video.test'
+
+    def getAddonInfo(self, key):
+        return {
+            'id': self._id,
+            'name': self._id,
+            'version': '1.0.0',
+            'path': 'special://home/addons/{}/'.format(self._id),
+            'profile': 'special://profile/addon_data/{}/'.format(self._id),
+        }.get(key, '')
+
+    def getSetting(self, key):
+        return self._settings.get((self._id, key), '')
+
+    def setSetting(self, key, value):
+        self._settings[(self._id, key)] = value
+
+    def getLocalizedString(self, id):
+        return str(id)
+
+    def openSettings(self):
+        pass
+
+class _Monitor(object):
+    def abortRequested(self):
+        return False
+
+    def waitForAbort(self, timeout=0):
+        return False
+
+class _Window(object):
+    _properties = {}
+
+    def __init__(self, id=None):
+        pass
+
+    def getProperty(self, key):
+        return self._properties.get(key, '')
+
+    def setProperty(self, key, value):
+        self._properties[key] = value
+
+    def clearProperty(self, key):
+        self._properties.pop(key, None)
+
+class _Dialog(object):
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: -1
+
+def _noop(*args, **kwargs):
+    return None
+
+def _module(name, **attrs):
+    module = types.ModuleType(name)
+    module.__dict__.update(attrs)
+    sys.modules[name] = module
+    return module
+
+def install():
+    if 'xbmc' in sys.modules:
+        return
+
+    _module('xbmc',
+        LOGDEBUG=0, LOGINFO=1, LOGNOTICE=1, LOGWARNING=2, LOGERROR=3, LOGFATAL=4, LOGNONE=5,
+        PLAYLIST_VIDEO=1, PLAYLIST_MUSIC=0,
+        log=_noop, sleep=_noop, executebuiltin=_noop,
+        translatePath=_translate_path,
+        getInfoLabel=lambda label: '19.0',
+        getCondVisibility=lambda condition: False,
+        executeJSONRPC=lambda data: '{"result": {}}',
+        getUserAgent=lambda: 'Kodi/19.0',
+        Monitor=_Monitor, Player=object, PlayList=object,
+    )
+    _module('xbmcaddon', Addon=_Addon)
+    _module('xbmcgui', Window=_Window, Dialog=_Dialog, DialogProgress=_Dialog, DialogProgressBG=_Dialog, ListItem=_Dialog, ALPHANUM_HIDE_INPUT=1)
+    _module('xbmcplugin', setResolvedUrl=_noop, endOfDirectory=_noop, addDirectoryItem=_noop, setContent=_noop, setPluginCategory=_noop, addSortMethod=_noop)
+    _module('xbmcvfs', exists=os.path.exists, translatePath=_translate_path, listdir=lambda path: ([], []), delete=_noop, copy=_noop, mkdirs=_noop)
+    _module('xbmcdrm')
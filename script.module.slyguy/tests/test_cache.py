@@ -0,0 +1,48 @@
+import pytest
+
+from slyguy import cache, database
+
+@pytest.fixture
+def store(monkeypatch):
+    database.db.connect(reuse_if_open=True)
+    database.db.create_tables([database.KeyStore, cache.Cache])
+    cache.empty()
+    monkeypatch.setattr(cache, 'max_size', lambda: 10000)
+    monkeypatch.setattr(cache, '_dumps', lambda value: (value, False))
+    yield
+    cache.empty()
+    database.db.close()
+
+def size():
+    return int(database.KeyStore.get(database.KeyStore.key == cache.CACHE_SIZE_KEY).value)
+
+def test_running_total(store, monkeypatch):
+    cache.set('a', b'x' * 1000)
+    assert size() == 1000
+
+    evictions = []
+    monkeypatch.setattr(cache, 'evict', lambda: evictions.append(1))
+    for i in range(5):
+        cache.set('b{}'.format(i), b'x' * 1000)
+
+    assert size() == 6000
+    assert not evictions
+
+def test_evicts_least_recently_used(store):
+    for i in range(10):
+        cache.set(str(i), b'x' * 1000)
+        cache.Cache.update(accessed=i).where(cache.Cache.key == str(i)).execute()
+
+    cache.set('new', b'x' * 2500)
+
+    keys = [row.key for row in cache.Cache.select(cache.Cache.key)]
+    assert len(keys) == 8
+    assert not cache.Cache.select().where(cache.Cache.key.in_(['0', '1', '2'])).exists()
+    assert size() == 9500
+
+def test_replace_over_count_is_corrected(store):
+    for i in range(15):
+        cache.set('same', b'x' * 1000)
+
+    assert cache.Cache.select().count() == 1
+    assert size() <= 10000
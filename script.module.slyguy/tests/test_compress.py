@@ -0,0 +1,66 @@
+import gzip
+from io import BytesIO
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from urllib3.response import HTTPResponse
+
+from resources.lib import proxy
+
+MANIFEST_URL = 'https://origin.example.com/manifest.mpd'
+BODY = b'<MPD>' + b'x' * 5000 + b'</MPD>'
+
+def gzipped(data):
+    buffer = BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as f:
+        f.write(data)
+    return buffer.getvalue()
+
+class Session(object):
+    def __init__(self, content_type):
+        self.headers = {}
+        self.content_type = content_type
+        self.sent = None
+
+    def request(self, method, url, headers=None, **kwargs):
+        self.sent = headers
+        data = gzipped(BODY) if 'gzip' in headers.get('accept-encoding', '') else BODY
+        response_headers = {'content-type': self.content_type, 'content-length': str(len(data))}
+        if data != BODY:
+            response_headers['content-encoding'] = 'gzip'
+
+        response = requests.Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict(response_headers)
+        response.raw = HTTPResponse(body=BytesIO(data), headers=response_headers, status=200, preload_content=False, decode_content=False)
+        return response
+
+def proxy_request(url, content_type, headers=None):
+    handler = proxy.RequestHandler.__new__(proxy.RequestHandler)
+    handler._session = {'session': Session(content_type), 'manifest': MANIFEST_URL}
+    handler._headers = headers or {}
+    handler._post_data = None
+    return handler._session['session'], handler._proxy_request('GET', url)
+
+def test_manifest_decoded():
+    session, response = proxy_request(MANIFEST_URL, 'application/octet-stream')
+    assert 'gzip' in session.sent['accept-encoding']
+    assert 'content-encoding' not in response.headers
+    assert 'content-length' not in response.headers
+    # the size guard in _do_GET still sees the upstream length
+    assert response.encoded_length == len(gzipped(BODY))
+    assert b''.join(response.stream.iter_content()) == BODY
+
+def test_text_content_type_decoded():
+    session, response = proxy_request('https://origin.example.com/playlist', 'application/vnd.apple.mpegurl; charset=utf-8')
+    assert b''.join(response.stream.iter_content()) == BODY
+
+def test_compressed_binary_passed_through():
+    session, response = proxy_request('https://origin.example.com/segment', 'video/mp4')
+    assert response.headers['content-encoding'] == 'gzip'
+    assert b''.join(response.stream.iter_content()) == gzipped(BODY)
+
+def test_range_not_compressed():
+    session, response = proxy_request(MANIFEST_URL, 'application/dash+xml', headers={'range': 'bytes=0-100'})
+    assert 'accept-encoding' not in session.sent
+    assert response.stream.content == BODY
@@ -0,0 +1,67 @@
+import os
+import glob
+import xml.etree.ElementTree as ET
+from xml.dom.minidom import parseString
+
+import pytest
+
+from slyguy.constants import QUALITY_BEST, QUALITY_LOWEST
+from resources.lib import proxy
+
+## Expected output was generated by the original minidom implementation ##
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'dash')
+MANIFESTS = sorted(glob.glob(os.path.join(FIXTURES, '*.mpd')))
+MANIFEST_URL = 'https://origin.example.com/manifest.mpd'
+
+SESSIONS = {
+    'best': {'quality': QUALITY_BEST, 'default_language': 'de', 'subtitles': [['text/vtt', 'fr', 'https://subs.example.com/fr.vtt'], ['application/ttml+xml', 'es', 'https://subs.example.com/es.ttml']]},
+    'lowest': {'quality': QUALITY_LOWEST},
+}
+
+class Response(object):
+    def __init__(self, content):
+        self.url = MANIFEST_URL
+        self.headers = {}
+        self.stream = proxy.ResponseStream(self)
+        self.stream.content = content
+
+def parse_dash(data, session):
+    handler = proxy.RequestHandler.__new__(proxy.RequestHandler)
+    handler._session = dict(session, manifest=MANIFEST_URL)
+    handler._headers = {}
+    handler._plugin_headers = {}
+
+    response = Response(data)
+    handler._parse_dash(response)
+    return response.stream.content
+
+def tree(data):
+    # Namespace resolved so where a prefix is declared doesn't matter, only what every name resolves to
+    def _tree(elem):
+        return (elem.tag, sorted(elem.attrib.items()), (elem.text or '').strip(), [_tree(child) for child in elem])
+
+    return _tree(ET.fromstring(data.replace(proxy.PROXY_PATH.encode('utf8'), b'http://proxy/')))
+
+def read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+@pytest.mark.parametrize('path', MANIFESTS, ids=os.path.basename)
+def test_parse_xml_matches_minidom(path):
+    data = read(path)
+    assert tree(ET.tostring(proxy._parse_xml(data))) == tree(parseString(data).toxml('utf-8'))
+
+@pytest.mark.parametrize('name', sorted(SESSIONS))
+@pytest.mark.parametrize('path', MANIFESTS, ids=os.path.basename)
+def test_parse_dash(path, name):
+    expected = os.path.join(FIXTURES, 'expected', os.path.basename(path)[:-4] + '.{}.mpd'.format(name))
+    assert tree(parse_dash(read(path), SESSIONS[name])) == tree(read(expected))
+
+def test_nested_default_namespace():
+    data = read(os.path.join(FIXTURES, 'live_scte35.mpd'))
+    root = ET.fromstring(parse_dash(data, SESSIONS['lowest']))
+
+    assert root.tag == '{urn:mpeg:dash:schema:mpd:2011}MPD'
+    assert root.find('.//{http://www.scte.org/schemas/35/2016}SpliceInfoSection') is not None
+    assert root.find('.//{http://www.scte.org/schemas/35/2016}Binary') is not None
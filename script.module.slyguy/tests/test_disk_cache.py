@@ -0,0 +1,58 @@
+import os
+import shutil
+
+from resources.lib import proxy
+
+SESSION = {'session_id': 'test', 'disk_cache': 1024*1024}
+URL = 'https://cdn.example.com/segment.m4s'
+
+def write(writer, data, complete=True):
+    for i in range(0, len(data), 1024):
+        writer.write(data[i:i+1024])
+    writer.close(complete=complete)
+
+def read(cache):
+    f, headers = cache.get(SESSION, URL)
+    with f:
+        return f.read(), headers
+
+def test_same_url_written_twice_at_once(tmpdir):
+    cache = proxy.DiskCache(str(tmpdir))
+    first = cache.writer(SESSION, URL, {'content-length': '5000'})
+    second = cache.writer(SESSION, URL, {})
+
+    first.write(b'a' * 2000)
+    write(second, b'b' * 5000)
+    write(first, b'a' * 3000)
+
+    assert read(cache) == (b'a' * 5000, {'content-length': '5000'})
+    assert os.listdir(str(tmpdir)) == [cache._key(SESSION, URL)]
+
+def test_incomplete_or_too_large_not_cached(tmpdir):
+    cache = proxy.DiskCache(str(tmpdir))
+    write(cache.writer(SESSION, URL, {'content-length': '5000'}), b'a' * 4000)
+    write(cache.writer(SESSION, URL, {}), b'a' * 100, complete=False)
+    write(cache.writer(dict(SESSION, disk_cache=1000), URL, {}), b'a' * 2000)
+
+    assert cache.get(SESSION, URL) is None
+    assert os.listdir(str(tmpdir)) == []
+
+def test_cleared_mid_write(tmpdir):
+    path = str(tmpdir.join('segments'))
+    cache = proxy.DiskCache(path)
+    writer = cache.writer(SESSION, URL, {})
+    writer.write(b'a' * 1000)
+
+    shutil.rmtree(path)
+    writer.write(b'a' * 1000)
+    writer.close(complete=True)
+
+    assert cache.get(SESSION, URL) is None
+
+def test_evicted_file_is_a_miss(tmpdir):
+    cache = proxy.DiskCache(str(tmpdir))
+    write(cache.writer(SESSION, URL, {}), b'a' * 1000)
+    os.remove(os.path.join(str(tmpdir), cache._key(SESSION, URL)))
+
+    assert cache.get(SESSION, URL) is None
+    assert cache._size == 0
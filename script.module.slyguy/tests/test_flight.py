@@ -0,0 +1,49 @@
+import os
+import time
+import threading
+
+from slyguy import flight
+
+def test_no_waiter_no_result():
+    lock_path, result_path, wait_path = flight._paths('no_waiter')
+    assert flight.run('no_waiter', lambda: 'value') == 'value'
+    assert not os.path.exists(lock_path)
+    assert not os.path.exists(result_path)
+
+def test_waiter_shares_result():
+    lock_path, result_path, wait_path = flight._paths('shared')
+    calls = []
+
+    def func():
+        calls.append(1)
+        while not os.path.exists(wait_path):
+            time.sleep(0.01)
+        return 'value'
+
+    results = []
+    holder = threading.Thread(target=lambda: results.append(flight.run('shared', func)))
+    holder.start()
+    while not os.path.exists(lock_path):
+        time.sleep(0.01)
+
+    results.append(flight.run('shared', func))
+    holder.join()
+
+    assert results == ['value', 'value']
+    assert len(calls) == 1
+    assert not os.path.exists(wait_path)
+
+def test_taken_over_lock_is_kept():
+    lock_path, result_path, wait_path = flight._paths('taken_over')
+
+    def func():
+        # another process decided our lock was stale and took it over
+        with open(lock_path, 'w') as f:
+            f.write('other')
+        return 'value'
+
+    try:
+        assert flight.run('taken_over', func) == 'value'
+        assert flight._read_token(lock_path) == 'other'
+    finally:
+        os.remove(lock_path)
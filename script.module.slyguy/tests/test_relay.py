@@ -0,0 +1,101 @@
+import socket
+
+from resources.lib import proxy
+
+BODY = b'segment' * 10000
+
+class Raw(object):
+    def __init__(self, fp=None):
+        self._data = BODY
+        if fp:
+            self._fp = fp
+
+    def read(self, size):
+        data, self._data = self._data[:size], self._data[size:]
+        return data
+
+    def release_conn(self):
+        pass
+
+class BrokenReadinto(object):
+    def readinto(self, buffer):
+        raise TypeError('readinto() changed')
+
+class Response(object):
+    def __init__(self, raw):
+        self.raw = raw
+        self.headers = {}
+
+def relay(raw):
+    client, server = socket.socketpair()
+    try:
+        written = proxy.ResponseStream(Response(raw)).relay(server)
+        server.close()
+
+        data = b''
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        client.close()
+
+    return written, data
+
+def test_relay_without_fp():
+    assert relay(Raw()) == (len(BODY), BODY)
+
+def test_relay_readinto_fallback():
+    assert relay(Raw(BrokenReadinto())) == (len(BODY), BODY)
+
+class Handler(proxy.RequestHandler):
+    def __init__(self, command, sock):
+        self.command = command
+        self.request_version = 'HTTP/1.1'
+        self.requestline = '{} /segment.ts HTTP/1.1'.format(command)
+        self.protocol_version = 'HTTP/1.1'
+        self.close_connection = False
+        self._plugin_headers = {}
+        self.connection = sock
+        self.wfile = sock.makefile('wb')
+
+    def log_message(self, format, *args):
+        return
+
+def output(command, path):
+    response = Response(None)
+    response.status_code = 200
+    response.headers = {'content-length': str(len(BODY))}
+    response.stream = proxy.FileResponseStream(response, path)
+
+    client, server = socket.socketpair()
+    try:
+        handler = Handler(command, server)
+        written = handler._output_response(response)
+        handler.wfile.close()
+        server.close()
+
+        data = b''
+        while True:
+            chunk = client.recv(65536)
+            if not chunk:
+                break
+            data += chunk
+    finally:
+        client.close()
+
+    return written, data
+
+def test_head_has_no_body(tmpdir):
+    path = str(tmpdir.join('segment.ts'))
+    with open(path, 'wb') as f:
+        f.write(BODY)
+
+    written, data = output('HEAD', path)
+    assert written == 0
+    assert data.endswith(b'\r\n\r\n')
+
+    written, data = output('GET', path)
+    assert written == len(BODY)
+    assert data.endswith(BODY)
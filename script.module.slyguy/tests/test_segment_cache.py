@@ -0,0 +1,33 @@
+from resources.lib import proxy
+
+class SegmentCache(proxy.SegmentCache):
+    def __init__(self):
+        super(SegmentCache, self).__init__()
+        self.fetched = []
+
+    def _fetch(self, session, url, headers):
+        self.fetched.append(url)
+        return {'headers': {}, 'content': b'segment'}
+
+def test_served_segments_not_prefetched_again(monkeypatch):
+    session = {}
+    monkeypatch.setitem(proxy.PROXY_GLOBAL, 'session', session)
+
+    cache = SegmentCache()
+    for url in ('1.ts', '2.ts', '3.ts'):
+        cache.prefetch(session, url, {})
+
+    assert cache.get('1.ts')['content'] == b'segment'
+    assert cache.get('2.ts')['content'] == b'segment'
+
+    # next playlist refresh still lists the served segments
+    for url in ('2.ts', '3.ts', '4.ts'):
+        cache.prefetch(session, url, {})
+
+    assert cache.get('4.ts')
+    assert sorted(cache.fetched) == ['1.ts', '2.ts', '3.ts', '4.ts']
+
+    cache.clear()
+    cache.prefetch(session, '1.ts', {})
+    assert cache.get('1.ts')
+    assert cache.fetched.count('1.ts') == 2
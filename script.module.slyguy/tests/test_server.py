@@ -0,0 +1,56 @@
+import json
+import time
+import threading
+from io import BytesIO
+
+import pytest
+from six.moves import queue
+
+from resources.lib import proxy
+
+def test_poll_put_does_not_block():
+    server = proxy.PooledHTTPServer.__new__(proxy.PooledHTTPServer)
+    server._queue = queue.Queue(maxsize=1)
+    server._queue.put('busy')
+
+    rejected = []
+    server._reject = rejected.append
+
+    start = time.time()
+    server._put_job('job', block=False)
+    assert time.time() - start < 1
+    assert rejected == ['job']
+
+def test_session_limit_returns_503(monkeypatch):
+    monkeypatch.setattr(proxy, 'PROXY_QUEUE_TIMEOUT', 0.01)
+
+    semaphore = threading.BoundedSemaphore(1)
+    semaphore.acquire()
+
+    handler = proxy.RequestHandler.__new__(proxy.RequestHandler)
+    handler._session = {'semaphore': semaphore}
+    handler._get_url = lambda: 'https://cdn.example.com/segment.ts'
+    handler._proxy_request = lambda *args: pytest.fail('request made without a session slot')
+
+    errors = []
+    handler.send_error = lambda code, message=None: errors.append(code)
+
+    handler.do_HEAD()
+    assert errors == [503]
+
+def test_seed_bandwidth_uses_headroom(monkeypatch):
+    seeded = []
+    monkeypatch.setattr(proxy.inputstream, 'set_bandwidth_bin', seeded.append)
+    monkeypatch.setattr(proxy.settings, 'getBool', lambda key, default=False: True)
+    monkeypatch.setattr(proxy.settings, 'getInt', lambda key, default=0: 25 if key == 'proxy_quality_headroom' else default)
+    monkeypatch.setattr(proxy.THROUGHPUT, 'get', lambda host: 8000000)
+    monkeypatch.setattr(proxy, 'PROXY_GLOBAL', dict(proxy.PROXY_GLOBAL, session={}))
+
+    body = json.dumps({'session_id': 'seeded', 'manifest': 'https://cdn.example.com/manifest.mpd'}).encode('utf8')
+    handler = proxy.RequestHandler.__new__(proxy.RequestHandler)
+    handler.headers = {'content-length': str(len(body))}
+    handler.rfile = BytesIO(body)
+    handler._send_json = lambda data: None
+    handler._register_session()
+
+    assert seeded == [6000000]
@@ -0,0 +1,43 @@
+import os
+
+from slyguy import gui
+from slyguy.router import url_for
+from slyguy.constants import ROUTE_WEBVTT
+from resources.lib import proxy
+
+VTT = b'WEBVTT\n\n00:00:01.000 --> 00:00:02.000\nHello\n'
+
+def test_pointers_pruned(tmpdir):
+    cache = proxy.SubtitleCache(str(tmpdir), max_files=2)
+    for i in range(5):
+        cache.convert('https://subs.example.com/en.vtt?token={}'.format(i), VTT)
+
+    files = os.listdir(str(tmpdir))
+    assert len([x for x in files if x.startswith('c_')]) == 1
+    assert len([x for x in files if x.startswith('u_')]) == 2
+    assert cache.get('https://subs.example.com/en.vtt?token=4') is not None
+
+def test_pointer_expires(tmpdir):
+    cache = proxy.SubtitleCache(str(tmpdir))
+    url = 'https://subs.example.com/en.vtt'
+    vtt = cache.convert(url, VTT)
+    assert cache.get(url) == vtt
+
+    pointer = cache._file('u_', url)
+    old = os.path.getmtime(pointer) - proxy.SUBTITLE_POINTER_TTL - 1
+    os.utime(pointer, (old, old))
+
+    assert cache.get(url) is None
+    assert not os.path.exists(pointer)
+
+def test_no_shared_temp_file(tmpdir):
+    cache = proxy.SubtitleCache(str(tmpdir))
+    cache.convert('https://subs.example.com/a.vtt', VTT)
+    cache.convert('https://subs.example.com/b.vtt', VTT)
+
+    assert not [x for x in os.listdir(str(tmpdir)) if x.endswith('.tmp')]
+
+def test_webvtt_route_needs_no_callbacks():
+    webvtt = url_for(ROUTE_WEBVTT, url='https://subs.example.com/en.ttml')
+    assert not gui._needs_callbacks({'path_subs': {'en.srt': webvtt}})
+    assert gui._needs_callbacks({'license_url': 'plugin://plugin.video.test/?_=license'})
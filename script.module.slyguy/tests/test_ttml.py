@@ -0,0 +1,76 @@
+import os
+import io
+import glob
+import collections
+
+import pytest
+
+from slyguy import ttml
+
+## Expected output is checked in as WebVTT. pycaption is the reference where it can read the input ##
+## (it fails on tick / frame timing and prefixed tt: elements, which ttml.py handles) ##
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'ttml')
+DOCUMENTS = sorted(glob.glob(os.path.join(FIXTURES, '*.ttml')))
+PYCAPTION_DOCUMENTS = [os.path.join(FIXTURES, 'clock.ttml')]
+
+def sample(count):
+    xml = ['<?xml version="1.0" encoding="utf-8"?><tt xmlns="http://www.w3.org/ns/ttml" xmlns:tts="http://www.w3.org/ns/ttml#styling" xml:lang="en"><body><div>']
+    for i in range(count):
+        begin, end = i * 2, i * 2 + 1
+        xml.append('<p begin="{:02d}:{:02d}:{:02d}.{:03d}" end="{:02d}:{:02d}:{:02d}.{:03d}">Line {} of the sample<br/>with a <span tts:fontStyle="italic">styled</span> word</p>'.format(
+            begin // 3600, begin // 60 % 60, begin % 60, i % 8 * 125, end // 3600, end // 60 % 60, end % 60, i % 8 * 125, i))
+    xml.append('</div></body></tt>')
+    return ''.join(xml)
+
+def pycaption_webvtt(text):
+    # the bundled bs4 used by pycaption predates python 3.10
+    if not hasattr(collections, 'Callable'):
+        from collections import abc
+        collections.Callable = abc.Callable
+
+    from pycaption import DFXPReader, WebVTTWriter
+    return WebVTTWriter().write(DFXPReader().read(text))
+
+def cues(vtt):
+    # pycaption and ttml.py differ in blank lines around the header only
+    return [block.strip() for block in vtt.split('\n\n') if block.strip() and block.strip() != 'WEBVTT']
+
+def read(path):
+    with io.open(path, 'r', encoding='utf8', newline='') as f:
+        return f.read()
+
+@pytest.mark.parametrize('path', DOCUMENTS, ids=os.path.basename)
+def test_to_webvtt(path):
+    expected = os.path.join(FIXTURES, 'expected', os.path.basename(path)[:-5] + '.vtt')
+    assert ttml.to_webvtt(read(path)) == read(expected)
+
+@pytest.mark.parametrize('path', PYCAPTION_DOCUMENTS, ids=os.path.basename)
+def test_matches_pycaption(path):
+    text = read(path)
+    assert cues(ttml.to_webvtt(text)) == cues(pycaption_webvtt(text))
+
+def test_matches_pycaption_sample():
+    text = sample(200)
+    assert cues(ttml.to_webvtt(text)) == cues(pycaption_webvtt(text))
+
+def test_sub_frames():
+    text = '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttp="http://www.w3.org/ns/ttml#parameter" ttp:frameRate="25" ttp:subFrameRate="4"><body><div><p begin="00:00:01:10.2" end="00:00:02:00">x</p></div></body></tt>'
+    # 10 frames + 2/4 of a frame at 25fps
+    assert cues(ttml.to_webvtt(text)) == ['00:00:01.420 --> 00:00:02.000\nx']
+
+@pytest.mark.parametrize('text', [
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttp="http://www.w3.org/ns/ttml#parameter" ttp:timeBase="smpte"><body><div><p begin="1s" end="2s">x</p></div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml"><body><div><p begin="1s" end="2s">x<span begin="1s">y</span></p></div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml"><body><div><p begin="1s">x</p></div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml"><body><div><p begin="1s" end="2s">x</div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml"><body><div><span>x</span><p begin="1s" end="2s">x</p></div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml"><body><div><br/><p begin="1s" end="2s">x</p></div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttp="http://www.w3.org/ns/ttml#parameter" ttp:frameRate="25" ttp:frameRateMultiplier="1000"><body><div><p begin="1s" end="2s">x</p></div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttp="http://www.w3.org/ns/ttml#parameter" ttp:frameRate="abc"><body><div><p begin="1s" end="2s">x</p></div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttp="http://www.w3.org/ns/ttml#parameter" ttp:subFrameRate="1.5"><body><div><p begin="1s" end="2s">x</p></div></body></tt>',
+    '<tt xmlns="http://www.w3.org/ns/ttml" xmlns:ttp="http://www.w3.org/ns/ttml#parameter" ttp:tickRate="0"><body><div><p begin="10t" end="20t">x</p></div></body></tt>',
+], ids=['time_base', 'timed_span', 'no_end', 'bad_xml', 'span_outside_p', 'br_outside_p', 'frame_rate_multiplier', 'frame_rate', 'sub_frame_rate', 'tick_rate'])
+def test_unsupported(text):
+    with pytest.raises(ttml.TTMLError):
+        ttml.to_webvtt(text)
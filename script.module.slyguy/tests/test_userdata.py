@@ -0,0 +1,24 @@
+from slyguy import userdata, signals
+
+def test_none_is_not_default():
+    userdata.set('none', None)
+    assert userdata.get('none', 'default') is None
+    assert userdata.pop('none', 'default') is None
+    assert userdata.get('none', 'default') == 'default'
+
+def test_none_in_batch():
+    with userdata.batch():
+        userdata.set('batched', None)
+        assert userdata.get('batched', 'default') is None
+
+    assert userdata.get('batched', 'default') is None
+    userdata.delete('batched')
+
+def test_closed_on_close():
+    userdata.set('key', 1)
+    assert userdata._userdata._conn is not None
+
+    signals.emit(signals.ON_CLOSE)
+    assert userdata._userdata._conn is None
+    assert userdata.get('key') == 1
+    userdata.delete('key')
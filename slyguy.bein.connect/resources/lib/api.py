@@ -106,8 +106,9 @@ class API(object):
 
     def _set_auth(self, auth_token):
         token_data = jwt_data(auth_token)
-        userdata.set('auth_token', auth_token)
-        userdata.set('token_expires', token_data['exp'] - 30)
+        with userdata.batch():
+            userdata.set('auth_token', auth_token)
+            userdata.set('token_expires', token_data['exp'] - 30)
         self._set_authentication()
 
     def _select_device(self, token):
@@ -23,7 +23,7 @@ def home(**kwargs):
 
     return folder
 
-@cached(60*15)
+@cached(60*15, copy=False)
 def _app_data():
     return Session().gz_json(DATA_URL)
 
@@ -22,26 +22,24 @@ def home(**kwargs):
 
     return folder
 
-@mem_cache.cached(60*15)
+@mem_cache.cached(60*15, copy=False)
 def _data():
     return Session().gz_json(DATA_URL)
 
 def _app_data():
     data = _data()
 
+    regions = {ALL: {'logo': None, 'name':_.ALL, 'channels': {}, 'sort': 0}}
     for key in data['regions']:
-        data['regions'][key]['sort'] = 1
-        data['regions'][key]['channels'] = {}
-
-    data['regions'][ALL] = {'logo': None, 'name':_.ALL, 'channels': {}, 'sort': 0}
+        regions[key] = dict(data['regions'][key], sort=1, channels={})
 
     for id in data['channels']:
         channel = data['channels'][id]
         for code in channel['regions']:
-            data['regions'][code]['channels'][id] = channel
-            data['regions'][ALL]['channels'][id] = channel
+            regions[code]['channels'][id] = channel
+            regions[ALL]['channels'][id] = channel
 
-    return data
+    return dict(data, regions=regions)
 
 def _process_channels(channels, query=None):
     items = []
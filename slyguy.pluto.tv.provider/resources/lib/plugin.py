@@ -22,21 +22,19 @@ def home(**kwargs):
 
     return folder
 
-@mem_cache.cached(60*15)
+@mem_cache.cached(60*15, copy=False)
 def _data():
     return Session().gz_json(DATA_URL)
 
 def _app_data():
     data = _data()
 
-    region = {'logo': None, 'name':_.ALL, 'channels': {}, 'sort': 0}
+    regions = {ALL: {'logo': None, 'name':_.ALL, 'channels': {}, 'sort': 0}}
     for key in data['regions']:
-        data['regions'][key]['sort'] = 1
-        region['channels'].update(data['regions'][key]['channels'])
+        regions[key] = dict(data['regions'][key], sort=1)
+        regions[ALL]['channels'].update(data['regions'][key]['channels'])
 
-    data['regions'][ALL] = region
-
-    return data
+    return dict(data, regions=regions)
 
 def _process_channels(channels, group=ALL):
     items = []
@@ -201,7 +199,7 @@ def play(id, **kwargs):
     if not channel:
         raise Exception('Unable to find that channel')
 
-    headers = data.get('headers', {})
+    headers = dict(data.get('headers', {}))
     headers.update(region.get('headers', {}))
     headers.update(channel.get('headers', {}))
 
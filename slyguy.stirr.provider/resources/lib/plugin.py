@@ -21,7 +21,7 @@ def home(**kwargs):
 
     return folder
 
-@mem_cache.cached(60*5)
+@mem_cache.cached(60*5, copy=False)
 def _app_data():
     return Session().gz_json(DATA_URL)
 